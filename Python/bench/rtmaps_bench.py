@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+# coding=utf-8
+#
+#  Copyright (C) INTEMPORA S.A.S
+#  ALL RIGHTS RESERVED.
+#
+"""
+Micro-benchmarks of the Python wrapper (rtmaps.py) against the stub engine library of stub_librtmaps.c, so that
+no RTMaps install is needed and only the cost of the wrapper is measured.
+
+For every benchmarked call, the JSON results give the calls per second and nanoseconds per call (best of the
+repeats), the bytes of Python memory allocated per call (tracemalloc peak during a call, median over the calls)
+and the memory blocks retained per call (a non-zero value is a leak). The report callback benchmarks give the
+number of engine messages per second handled by a Python report reader.
+
+Every RTMapsWrapper method is covered except: run, shutdown, reset, play, pause and the package registrations,
+one-off engine commands whose cost is the engine's (register_package and its variants go through parse, which is
+measured); subscribe and watch, background threads calling read_sample and the property getters, which are measured.
+
+    python bench/rtmaps_bench.py --output results.json
+    python bench/rtmaps_bench.py --compare results.json --tolerance 0.2
+
+With --simulated, the same benchmarks run against the SimulatedEngine of rtmaps_simulation (no C compiler needed),
+its outputs producing faster than they are read; its results measure the wrapper plus the simulated engine.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import timeit
+import tracemalloc
+from ctypes import Structure, c_double, c_int, c_int32
+
+bench_folder = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(bench_folder))
+
+import numpy as np
+
+from rtmaps import FramePool, RTMapsAbstraction, RTMapsDefaults, RTMapsWrapper, structure_dtype
+from rtmaps_simulation import SimulatedEngine, SimulatedModel
+
+COMPONENT = "Bench_1"
+OUTPUT = COMPONENT + ".o1"
+INPUT = COMPONENT + ".i1"
+PROPERTY = COMPONENT + ".p"
+TIMEOUT = 1000  # microseconds, never reached: the stub reads return at once, the simulated outputs are always due
+SIMULATED_RATE = 1e9  # Hz
+SIMULATED_TEXT_SIZE = 65536  # bytes, buffer of the text reads of the simulated output
+VECTOR_SIZE = 1000
+STREAM_SIZE = 4096
+BATCH_SIZE = 1000
+STRUCTURE_COUNT = 100
+REPORT_BATCH = 10000
+
+
+class BenchStructure(Structure):
+    _fields_ = [("id", c_int32), ("x", c_double), ("y", c_double)]
+
+
+def build_stub(output_folder):
+    """ Compiles stub_librtmaps.c with the C compiler of the CC environment variable (default: cc). """
+    library = os.path.join(output_folder, "stub_librtmaps.dll" if sys.platform == "win32" else "libstub_rtmaps.so")
+    command = [os.environ.get("CC", "cc"), "-shared", "-fPIC", "-O2", "-o", library, os.path.join(bench_folder, "stub_librtmaps.c")]
+    subprocess.check_call(command)
+    return library
+
+
+def wrapper_benchmarks(maps):
+    """ Calls of RTMapsWrapper, addressed by full names. """
+    W = RTMapsWrapper
+    vector = np.empty(VECTOR_SIZE)
+    stream = bytearray(STREAM_SIZE)
+    pool = FramePool(STREAM_SIZE)
+    values = np.arange(BATCH_SIZE, dtype=np.int64)
+    timestamps = np.arange(BATCH_SIZE, dtype=np.int64)
+    structures = np.empty(STRUCTURE_COUNT, dtype=structure_dtype(BenchStructure))
+    return {
+        "parse": lambda: W.parse(maps, PROPERTY + " = 1"),
+        "get_current_time": lambda: W.get_current_time(maps),
+        "is_running": lambda: W.is_running(maps),
+        "is_paused": lambda: W.is_paused(maps),
+        "get_integer_property": lambda: W.get_integer_property(maps, PROPERTY),
+        "get_float_property": lambda: W.get_float_property(maps, PROPERTY),
+        "get_string_property": lambda: W.get_string_property(maps, PROPERTY),
+        "get_enum_property": lambda: W.get_enum_property(maps, COMPONENT + ".e"),
+        "get_output_names_for_component": lambda: W.get_output_names_for_component(maps, COMPONENT),
+        "get_input_names_for_component": lambda: W.get_input_names_for_component(maps, COMPONENT),
+        "get_action_names_for_component": lambda: W.get_action_names_for_component(maps, COMPONENT),
+        "get_property_names_for_component": lambda: W.get_property_names_for_component(maps, COMPONENT),
+        "send_int32": lambda: W.send_int32(maps, INPUT, 1),
+        "send_int32_ts": lambda: W.send_int32_ts(maps, INPUT, 1, 1000),
+        "send_int64_ts": lambda: W.send_int64_ts(maps, INPUT, 1, 1000),
+        "send_float64_ts": lambda: W.send_float64_ts(maps, INPUT, 1.0, 1000),
+        "send_batch[{}]".format(BATCH_SIZE): lambda: W.send_batch(maps, INPUT, values, timestamps),
+        "read_int32": lambda: W.read_int32(maps, OUTPUT, True),
+        "read_int64": lambda: W.read_int64(maps, OUTPUT, True),
+        "read_int32_timeout": lambda: W.read_int32_timeout(maps, OUTPUT, TIMEOUT),
+        "read_int64_timeout": lambda: W.read_int64_timeout(maps, OUTPUT, TIMEOUT),
+        "read_float64_timeout": lambda: W.read_float64_timeout(maps, OUTPUT, TIMEOUT),
+        "read_text_timeout": lambda: W.read_text_timeout(maps, OUTPUT, TIMEOUT),
+        "read_sample[float64]": lambda: W.read_sample(maps, OUTPUT, "float64", TIMEOUT),
+        "read_float64_vector_timeout_meta[{}]".format(VECTOR_SIZE): lambda: W.read_float64_vector_timeout_meta(maps, OUTPUT, VECTOR_SIZE, TIMEOUT),
+        "read_float64_array_timeout_meta[{}]".format(VECTOR_SIZE): lambda: W.read_float64_array_timeout_meta(maps, OUTPUT, TIMEOUT, out=vector),
+        "read_user_structure_timeout_meta": lambda: W.read_user_structure_timeout_meta(maps, OUTPUT, BenchStructure, TIMEOUT),
+        "read_user_structure_vector_timeout_meta[{}]".format(STRUCTURE_COUNT): lambda: W.read_user_structure_vector_timeout_meta(maps, OUTPUT, BenchStructure, STRUCTURE_COUNT, TIMEOUT),
+        "read_user_structure_array_timeout_meta[{}]".format(STRUCTURE_COUNT): lambda: W.read_user_structure_array_timeout_meta(maps, OUTPUT, BenchStructure, STRUCTURE_COUNT, TIMEOUT, out=structures),
+        "read_stream8_timeout_meta[{}]".format(STREAM_SIZE): lambda: W.read_stream8_timeout_meta(maps, OUTPUT, TIMEOUT, STREAM_SIZE),
+        "readinto[{}]".format(STREAM_SIZE): lambda: W.readinto(maps, OUTPUT, stream, TIMEOUT),
+        "read_frame[{}]".format(STREAM_SIZE): lambda: W.read_frame(maps, OUTPUT, pool, TIMEOUT),
+    }
+
+
+def abstraction_benchmarks(maps):
+    """ Calls of RTMapsAbstraction, addressed by component and port, including its check_* validation. """
+    return {
+        "check_component_availability": lambda: maps.check_component_availability(COMPONENT),
+        "check_outport_availability": lambda: maps.check_outport_availability(COMPONENT, "o1"),
+        "check_property_availability": lambda: maps.check_property_availability(COMPONENT, "p"),
+        "check_enum_property_validity": lambda: maps.check_enum_property_validity(COMPONENT, "e", "b"),
+        "abstraction.set_property": lambda: maps.set_property(COMPONENT, "p", 1),
+        "abstraction.get_integer_property": lambda: maps.get_integer_property(COMPONENT, "p"),
+        "abstraction.read_float64_timeout": lambda: maps.read_float64_timeout(COMPONENT, "o1", TIMEOUT),
+        "abstraction.send_int32_ts": lambda: maps.send_int32_ts(COMPONENT, "i1", 1, 1000),
+    }
+
+
+def measure(function, repeat, min_time):
+    timer = timeit.Timer(function)
+    number = 1
+    while True:  # calibrates the number of calls per measure to last about min_time
+        elapsed = timer.timeit(number)
+        if elapsed >= min_time / 10:
+            break
+        number *= 10
+    number = max(int(number * min_time / elapsed), 1)
+    best = min(timer.repeat(repeat, number)) / number
+    return {"calls_per_second": 1.0 / best, "ns_per_call": best * 1e9}
+
+
+def measure_memory(function, calls=200):
+    function()  # first call allocations (caches, buffers) are not per-call costs
+    blocks = sys.getallocatedblocks()
+    for _ in range(calls):
+        function()
+    retained = (sys.getallocatedblocks() - blocks) / calls
+    peaks = []
+    tracemalloc.start()
+    try:
+        for _ in range(calls):
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            function()
+            peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    finally:
+        tracemalloc.stop()
+    return {"bytes_per_call": statistics.median(peaks), "retained_blocks_per_call": retained}
+
+
+def report_benchmarks(maps, repeat):
+    """ Messages per second handled by a no-op report reader and by the reader of rtmaps_runtime_ext. """
+    import rtmaps_runtime_ext
+    if isinstance(maps.lib, SimulatedEngine):
+        def emit(count, level):
+            for _ in range(count):
+                maps.lib.report(level, "Bench report")
+    else:
+        emit = maps.lib.maps_stub_emit_reports
+        emit.argtypes = [c_int, c_int]
+
+    def drain():
+        while not rtmaps_runtime_ext.g_reportQueue.empty():
+            rtmaps_runtime_ext.g_reportQueue.get_nowait()
+
+    readers = {
+        "report_reader[noop]": (lambda dummy, level, message: None, None),
+        "report_reader[rtmaps_runtime_ext]": (rtmaps_runtime_ext.onRtmapsReport, drain),
+    }
+    results = dict()
+    for name, (reader, cleanup) in readers.items():
+        maps.register_report_reader(reader)
+        times = []
+        for _ in range(repeat):
+            times.append(timeit.timeit(lambda: emit(REPORT_BATCH, 0), number=1))
+            if cleanup:
+                cleanup()
+        best = min(times) / REPORT_BATCH
+        results[name] = {"calls_per_second": 1.0 / best, "ns_per_call": best * 1e9}
+    maps.register_report_reader(lambda dummy, level, message: None)
+    return results
+
+
+def simulated_engine():
+    """ A SimulatedEngine with the component model of the stub library and an output always having a sample due. """
+    model = SimulatedModel(outputs=("o1", "o2"), inputs=("i1", "i2"), properties={"p": "1", "e": "b"},
+                           enums={"e": ["a", "b", "c"]}, actions=("act",))
+    engine = SimulatedEngine(models={"Model": model})
+    engine.add_producer(OUTPUT, "float64_vector", rate=SIMULATED_RATE, vector_size=VECTOR_SIZE)
+    return engine
+
+
+def run(repeat=5, min_time=0.05, selected=None, simulated=False):
+    maps = RTMapsAbstraction(backend=simulated_engine() if simulated else None)
+    maps.register_report_reader(lambda dummy, level, message: None)
+    maps.add_component("Model", COMPONENT)
+    maps.run()
+    if simulated:  # the simulated vectors are longer as text than the default buffer, which then grows once
+        RTMapsWrapper.read_text_timeout(maps, OUTPUT, TIMEOUT, SIMULATED_TEXT_SIZE)
+    benchmarks = wrapper_benchmarks(maps)
+    benchmarks.update(abstraction_benchmarks(maps))
+    results = dict()
+    for name, function in benchmarks.items():
+        if selected and not any(pattern in name for pattern in selected):
+            continue
+        results[name] = measure(function, repeat, min_time)
+        results[name].update(measure_memory(function))
+    if not selected or any("report_reader" in pattern for pattern in selected):
+        results.update(report_benchmarks(maps, repeat))
+    maps.shutdown()
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """ Names of the benchmarks more than tolerance (a fraction) slower than in the baseline results. """
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if reference and result["calls_per_second"] < reference["calls_per_second"] * (1 - tolerance):
+            regressions.append(name)
+    return regressions
+
+
+def cli(arg_list):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--library", type=str, help="Stub library to use instead of compiling stub_librtmaps.c")
+    parser.add_argument("--output", type=str, help="JSON file receiving the results (default: standard output)")
+    parser.add_argument("--compare", type=str, help="JSON results of a previous run to detect regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Slowdown tolerated by --compare, as a fraction (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=5, help="Measures per benchmark, the best one is kept (default: %(default)s)")
+    parser.add_argument("--min-time", type=float, default=0.05, help="Minimum seconds per measure (default: %(default)s)")
+    parser.add_argument("--simulated", action="store_true", help="Run against the simulated engine instead of the stub library")
+    parser.add_argument("--filter", type=str, action="append", help="Only run the benchmarks whose name contains this text")
+    args = parser.parse_args(arg_list)
+
+    if args.simulated:
+        results = run(args.repeat, args.min_time, args.filter, simulated=True)
+    else:
+        with tempfile.TemporaryDirectory() as build_folder:
+            library = os.path.abspath(args.library) if args.library else build_stub(build_folder)
+            os.environ[RTMapsDefaults.rtmaps_library_variable] = library
+            results = run(args.repeat, args.min_time, args.filter)
+
+    document = {
+        "date": datetime.datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "numpy": np.__version__,
+        "backend": "simulated" if args.simulated else "stub",
+        "results": results,
+    }
+    text = json.dumps(document, indent=2)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(text)
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            regressions = compare(results, json.load(baseline_file)["results"], args.tolerance)
+        for name in regressions:
+            sys.stderr.write("Regression: {}\n".format(name))
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(cli(sys.argv[1:]))
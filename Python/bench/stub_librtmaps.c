@@ -0,0 +1,227 @@
+/*
+ * Copyright (C) INTEMPORA S.A.S
+ * ALL RIGHTS RESERVED.
+ *
+ * Stub of librtmaps for the benchmarks of the Python wrapper: every maps_* function used by rtmaps.py returns
+ * immediately with plausible values, so that only the cost of the wrapper is measured, without any RTMaps install.
+ *
+ * - Every component has the outputs o1 and o2, the inputs i1 and i2, the action act and the properties p, e (an
+ *   enum with the values a, b and c), file, start, end, first, last and percentage.
+ * - Reads never wait: they return a new value stamped with the current time, vectors and streams fill the whole
+ *   buffer they are given.
+ * - maps_parse reports the command through the report callback and fails if it contains "FAIL".
+ * - Once running, the percentage property goes from 0 to 100 in one second.
+ * - maps_stub_emit_reports(count, level) calls the report callback count times (report throughput benchmark).
+ */
+#include <stdint.h>
+#include <stdio.h>
+#include <string.h>
+#include <time.h>
+
+#ifdef _WIN32
+#define EXPORT __declspec(dllexport)
+#else
+#define EXPORT
+#endif
+
+typedef struct {
+    int32_t cbSize;
+    uint32_t flags;
+    int64_t timestamp;
+    int64_t timeOfIssue;
+    int64_t frequency;
+    int32_t quality;
+    int32_t misc1, misc2, misc3;
+} maps_ioelt_metadata_t;
+
+typedef void (*report_reader_t)(void*, int, const char*);
+
+static report_reader_t g_reportReader;
+static void* g_reportReaderContext;
+static int g_running;
+static int64_t g_runStart;
+static int64_t g_counter;
+
+static int64_t now_us(void)
+{
+    struct timespec t;
+    timespec_get(&t, TIME_UTC);
+    return (int64_t)t.tv_sec * 1000000 + t.tv_nsec / 1000;
+}
+
+static void fill_metadata(maps_ioelt_metadata_t* metadata)
+{
+    if (metadata) {
+        int64_t t = now_us();
+        metadata->timestamp = t - 100;
+        metadata->timeOfIssue = t - 50;
+        metadata->frequency = 1000000;
+        metadata->quality = 0;
+    }
+}
+
+/* String getters: the needed size is returned in *size, -1 if the buffer is too small. */
+static int put_string(const char* value, char* buffer, int* size)
+{
+    int needed = (int)strlen(value) + 1;
+    if (!buffer || *size < needed) {
+        *size = needed;
+        return buffer ? -1 : 0;
+    }
+    memcpy(buffer, value, needed);
+    *size = needed;
+    return 0;
+}
+
+static int ends_with(const char* text, const char* end)
+{
+    size_t textLength = strlen(text), endLength = strlen(end);
+    return textLength >= endLength && !strcmp(text + textLength - endLength, end);
+}
+
+static void report(int level, const char* message)
+{
+    if (g_reportReader)
+        g_reportReader(g_reportReaderContext, level, message);
+}
+
+/* Engine */
+
+EXPORT int maps_init(int argc, char** argv) { return 0; }
+EXPORT int maps_exit(void) { return 0; }
+EXPORT int maps_run(void) { g_running = 1; g_runStart = now_us(); return 0; }
+EXPORT int maps_shutdown(void) { g_running = 0; return 0; }
+EXPORT int maps_reset(void) { g_running = 0; return 0; }
+EXPORT int maps_play(void) { return 0; }
+EXPORT int maps_stop(void) { return 0; }
+EXPORT int maps_pause(void) { return 0; }
+EXPORT int maps_parse(const char* command) { report(3, command); return strstr(command, "FAIL") ? -1 : 0; }
+EXPORT int maps_report(const char* message, int level) { report(level, message); return 0; }
+EXPORT int maps_register_report_reader(report_reader_t reader, void* context)
+{
+    g_reportReader = reader;
+    g_reportReaderContext = context;
+    return 0;
+}
+EXPORT int maps_get_current_time(int64_t* time) { *time = g_running ? now_us() : 0; return 0; }
+EXPORT int maps_is_running(int* running) { *running = g_running; return 0; }
+EXPORT int maps_is_paused(int* paused) { *paused = 0; return 0; }
+
+EXPORT int maps_stub_emit_reports(int count, int level)
+{
+    char message[64];
+    for (int i = 0; i < count; i++) {
+        snprintf(message, sizeof(message), "Info: component Stub_1: message %d", i);
+        report(level, message);
+    }
+    return 0;
+}
+
+/* Properties and introspection */
+
+EXPORT int maps_get_integer_property(const char* name, long* value)
+{
+    if (ends_with(name, ".percentage")) {
+        int64_t percentage = g_running ? (now_us() - g_runStart) / 10000 : 0;
+        *value = percentage > 100 ? 100 : (long)percentage;
+    } else if (ends_with(name, ".first")) {
+        *value = 0;
+    } else if (ends_with(name, ".last")) {
+        *value = 10000000;
+    } else {
+        *value = 42;
+    }
+    return 0;
+}
+EXPORT int maps_get_float_property(const char* name, double* value) { *value = 4.2; return 0; }
+EXPORT int maps_get_string_property(const char* name, char* buffer, int* size) { return put_string("hello", buffer, size); }
+EXPORT int maps_get_enum_property(const char* name, char* buffer, int* size)
+{
+    return put_string(ends_with(name, ".e") ? "3|1|a|b|c" : "", buffer, size);
+}
+
+/* Writes "component.name1|component.name2|..." for the null-terminated list of names. */
+static int put_names(const char* component, const char* const* names, char* buffer, int* size)
+{
+    char text[512] = "";
+    for (int i = 0; names[i]; i++) {
+        size_t length = strlen(text);
+        snprintf(text + length, sizeof(text) - length, "%s%s.%s", i ? "|" : "", component, names[i]);
+    }
+    return put_string(text, buffer, size);
+}
+
+static const char* const g_actions[] = { "act", NULL };
+static const char* const g_outputs[] = { "o1", "o2", NULL };
+static const char* const g_inputs[] = { "i1", "i2", NULL };
+static const char* const g_properties[] = { "p", "e", "file", "start", "end", "first", "last", "percentage", NULL };
+
+EXPORT int maps_get_action_names_for_component(const char* c, char* b, int* s) { return put_names(c, g_actions, b, s); }
+EXPORT int maps_get_output_names_for_component(const char* c, char* b, int* s) { return put_names(c, g_outputs, b, s); }
+EXPORT int maps_get_input_names_for_component(const char* c, char* b, int* s) { return put_names(c, g_inputs, b, s); }
+EXPORT int maps_get_property_names_for_component(const char* c, char* b, int* s) { return put_names(c, g_properties, b, s); }
+
+/* Sends */
+
+EXPORT int maps_send_int32(const char* name, int32_t value) { return 0; }
+EXPORT int maps_send_int32_ts(const char* name, int32_t value, int64_t timestamp) { return 0; }
+EXPORT int maps_send_int64_ts(const char* name, int64_t value, int64_t timestamp) { return 0; }
+EXPORT int maps_send_float64_ts(const char* name, double value, int64_t timestamp) { return 0; }
+
+/* Reads */
+
+EXPORT int maps_read_int32(const char* name, int wait, int32_t* value, int64_t* timestamp)
+{
+    *value = (int32_t)++g_counter;
+    *timestamp = now_us();
+    return 0;
+}
+EXPORT int maps_read_int64(const char* name, int wait, int64_t* value, int64_t* timestamp)
+{
+    *value = ++g_counter;
+    *timestamp = now_us();
+    return 0;
+}
+EXPORT int maps_read_int32_timeout(const char* name, int64_t timeout, int32_t* value, int64_t* timestamp)
+{
+    *value = (int32_t)++g_counter;
+    *timestamp = now_us();
+    return 0;
+}
+EXPORT int maps_read_int64_timeout(const char* name, int64_t timeout, int64_t* value, int64_t* timestamp)
+{
+    *value = ++g_counter;
+    *timestamp = now_us();
+    return 0;
+}
+EXPORT int maps_read_float64_timeout(const char* name, int64_t timeout, double* value, int64_t* timestamp)
+{
+    *value = (double)++g_counter;
+    *timestamp = now_us();
+    return 0;
+}
+EXPORT int maps_read_text_timeout(const char* name, int64_t timeout, char* buffer, int* size, int64_t* timestamp)
+{
+    if (timestamp)
+        *timestamp = now_us();
+    return put_string("some text", buffer, size);
+}
+EXPORT int maps_read_float64_vector_timeout_meta(const char* name, int64_t timeout, double* vector, int* size, maps_ioelt_metadata_t* metadata)
+{
+    for (int i = 0; i < *size; i++)
+        vector[i] = i + 0.5;
+    fill_metadata(metadata);
+    return 0;
+}
+EXPORT int maps_read_user_structure_timeout_meta(const char* name, int64_t timeout, void* buffer, int* size, maps_ioelt_metadata_t* metadata)
+{
+    memset(buffer, 1, *size);
+    fill_metadata(metadata);
+    return 0;
+}
+EXPORT int maps_read_stream8_timeout_meta(const char* name, int64_t timeout, unsigned char* buffer, int* size, maps_ioelt_metadata_t* metadata)
+{
+    memset(buffer, 'a', *size);
+    fill_metadata(metadata);
+    return 0;
+}
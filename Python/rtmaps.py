@@ -4,18 +4,25 @@
 #  ALL RIGHTS RESERVED.
 
 import atexit
+import hashlib
+import json
 import os
 import sys
 import logging
 from pathlib import Path
 import time
+import threading
+from collections import deque
+from functools import partial
+from itertools import repeat
 import xml.etree.ElementTree as et
 from ctypes import Structure, POINTER, c_ubyte, c_double, c_int32, c_int64, c_uint32, c_int8, sizeof
 from ctypes import byref, create_string_buffer, cdll
 from ctypes import c_void_p, c_char_p
-from ctypes import c_int, c_long, c_longlong, c_double
+from ctypes import c_int, c_long, c_double
+
+import numpy as np
 
-from numpy import int64
 if sys.platform == "win32":
     from ctypes import WINFUNCTYPE
 else:
@@ -32,6 +39,7 @@ class RTMapsException(Exception):
 
 class RTMapsDefaults(object):
     rtmaps_install_variable = "RTMAPS_SDKDIR"
+    rtmaps_library_variable = "RTMAPS_LIBRARY"  # overrides the path of the engine library (e.g. the stub built from bench/stub_librtmaps.c)
 
 
 class _Singleton(type):
@@ -67,6 +75,641 @@ class maps_ioelt_metadata_t(Structure):
                 super().__init__(cbSize)
 
 
+class RTMapsSample(object):
+    """ A value read from an output, with its timestamp and time of issue (None when the reader provides no metadata). """
+    __slots__ = ("value", "timestamp", "time_of_issue")
+
+    def __init__(self, value, timestamp, time_of_issue=None):
+        self.value = value
+        self.timestamp = timestamp
+        self.time_of_issue = time_of_issue
+
+    def __repr__(self):
+        return "RTMapsSample({!r}, timestamp={}, time_of_issue={})".format(self.value, self.timestamp, self.time_of_issue)
+
+    @classmethod
+    def from_meta(cls, value, meta):
+        return cls(value, meta.timestamp, meta.timeOfIssue)
+
+
+# Prototypes of the librtmaps functions used by the wrappers: name -> (restype, argtypes).
+# They are applied once when the library is loaded, see _MapsFunctionTable.
+_maps_prototypes = {
+    "maps_get_current_time": (c_int, [POINTER(c_int64)]),
+    "maps_is_running": (c_int, [POINTER(c_int)]),  # MAPS_BOOL is an int
+    "maps_is_paused": (c_int, [POINTER(c_int)]),
+    "maps_get_integer_property": (c_int, [c_char_p, POINTER(c_long)]),
+    "maps_get_float_property": (c_int, [c_char_p, POINTER(c_double)]),
+    "maps_get_string_property": (c_int, [c_char_p, c_char_p, POINTER(c_int)]),
+    "maps_get_enum_property": (c_int, [c_char_p, c_char_p, POINTER(c_int)]),
+    "maps_get_action_names_for_component": (c_int, [c_char_p, c_char_p, POINTER(c_int)]),
+    "maps_get_output_names_for_component": (c_int, [c_char_p, c_char_p, POINTER(c_int)]),
+    "maps_get_input_names_for_component": (c_int, [c_char_p, c_char_p, POINTER(c_int)]),
+    "maps_get_property_names_for_component": (c_int, [c_char_p, c_char_p, POINTER(c_int)]),
+    "maps_send_int32": (c_int, [c_char_p, c_int32]),
+    "maps_send_int32_ts": (c_int, [c_char_p, c_int32, c_int64]),
+    "maps_send_int64_ts": (c_int, [c_char_p, c_int64, c_int64]),
+    "maps_send_float64_ts": (c_int, [c_char_p, c_double, c_int64]),
+    "maps_read_int32": (c_int, [c_char_p, c_int, POINTER(c_int32), POINTER(c_int64)]),
+    "maps_read_int64": (c_int, [c_char_p, c_int, POINTER(c_int64), POINTER(c_int64)]),
+    "maps_read_int32_timeout": (c_int, [c_char_p, c_int64, POINTER(c_int32), POINTER(c_int64)]),
+    "maps_read_int64_timeout": (c_int, [c_char_p, c_int64, POINTER(c_int64), POINTER(c_int64)]),
+    "maps_read_float64_timeout": (c_int, [c_char_p, c_int64, POINTER(c_double), POINTER(c_int64)]),
+    "maps_read_text_timeout": (c_int, [c_char_p, c_int64, c_char_p, POINTER(c_int), POINTER(c_int64)]),
+    "maps_read_float64_vector_timeout_meta": (c_int, [c_char_p, c_int64, c_void_p, POINTER(c_int), POINTER(maps_ioelt_metadata_t)]),
+    "maps_read_user_structure_timeout_meta": (c_int, [c_char_p, c_int64, c_void_p, POINTER(c_int), POINTER(maps_ioelt_metadata_t)]),
+    "maps_read_stream8_timeout_meta": (c_int, [c_char_p, c_int64, POINTER(c_ubyte), POINTER(c_int), POINTER(maps_ioelt_metadata_t)]),
+}
+
+
+class _MapsFunctionTable(object):
+    """ The librtmaps functions listed in _maps_prototypes, with argtypes and restype already set. """
+    def __init__(self, lib):
+        for name, (restype, argtypes) in _maps_prototypes.items():
+            try:
+                func = getattr(lib, name)
+            except AttributeError:  # older libraries do not export every function
+                continue
+            func.argtypes = argtypes
+            func.restype = restype
+            setattr(self, name, func)
+
+
+class RTMapsPort(object):
+    """
+    Handle on a single input or output ("Component.port") of the diagram.
+
+    The encoded name and the out-parameters are allocated once, so reading or sending through a handle is a
+    single foreign call. Handles returned by RTMapsWrapper.port() are shared: a thread reading the same port
+    concurrently with another one should create its own RTMapsPort. The read_* and send_* methods of
+    RTMapsWrapper use a handle per thread, so they are reentrant.
+    """
+    __slots__ = ("name", "c_name", "_api", "_int32", "_int64", "_float64", "_timestamp", "_size",
+                 "_int32_ref", "_int64_ref", "_float64_ref", "_timestamp_ref", "_size_ref", "_vector", "_text", "_stream", "_records")
+
+    def __init__(self, api, name):
+        self.name = name
+        self.c_name = name.encode('utf-8')
+        self._api = api
+        self._int32 = c_int32()
+        self._int64 = c_int64()
+        self._float64 = c_double()
+        self._timestamp = c_int64()
+        self._size = c_int()
+        self._int32_ref = byref(self._int32)
+        self._int64_ref = byref(self._int64)
+        self._float64_ref = byref(self._float64)
+        self._timestamp_ref = byref(self._timestamp)
+        self._size_ref = byref(self._size)
+        self._vector = None
+        self._text = None
+        self._stream = None
+        self._records = None
+
+    def __repr__(self):
+        return "RTMapsPort({!r})".format(self.name)
+
+    @property
+    def timestamp(self):
+        """ Timestamp of the last sample read through this handle. """
+        return self._timestamp.value
+
+    def read_int32(self, wait_for_data):
+        if self._api.maps_read_int32(self.c_name, int(wait_for_data), self._int32_ref, self._timestamp_ref) == 0:
+            return self._int32.value
+        return None
+
+    def read_int64(self, wait_for_data):
+        if self._api.maps_read_int64(self.c_name, int(wait_for_data), self._int64_ref, self._timestamp_ref) == 0:
+            return self._int64.value
+        return None
+
+    def read_int32_timeout(self, timeout):
+        if self._api.maps_read_int32_timeout(self.c_name, int(timeout), self._int32_ref, self._timestamp_ref) == 0:
+            return self._int32.value
+        return None
+
+    def read_int64_timeout(self, timeout):
+        if self._api.maps_read_int64_timeout(self.c_name, int(timeout), self._int64_ref, self._timestamp_ref) == 0:
+            return self._int64.value
+        return None
+
+    def read_float64_timeout(self, timeout):
+        if self._api.maps_read_float64_timeout(self.c_name, int(timeout), self._float64_ref, self._timestamp_ref) == 0:
+            return self._float64.value
+        return None
+
+    def read_text_timeout(self, timeout, text_buffer_size=1024):
+        """
+        Reads a text into a buffer kept by the handle (of at least text_buffer_size bytes). When the engine reports
+        a larger size, the sample is lost: an RTMapsException is raised, and the buffer is grown to that size for
+        the next reads.
+        """
+        buffer = self._text
+        if buffer is None or len(buffer) < text_buffer_size:
+            buffer = self._text = create_string_buffer(text_buffer_size)
+        self._size.value = len(buffer)
+        result = self._api.maps_read_text_timeout(self.c_name, int(timeout), buffer, self._size_ref, self._timestamp_ref)
+        if self._size.value > len(buffer):
+            self._text = create_string_buffer(self._size.value)
+            raise RTMapsException("Text sample of {} lost: {} bytes needed, {} available. The buffer was grown for "
+                                  "the next reads".format(self.name, self._size.value, len(buffer)))
+        if result == 0:
+            return buffer.value.decode("utf-8")
+        return None
+
+    def read_sample(self, kind, timeout, vector_size=None):
+        """
+        Reads an "int32", "int64", "float64", "text", "float64_vector" or "stream8" sample and returns it as an
+        RTMapsSample, or None. For streams, vector_size is the buffer size in bytes (default 1024). Vectors and
+        streams are copied out of the pooled buffers, so samples stay valid after the next read.
+        """
+        if kind == "stream8":
+            buffer_size = vector_size or 1024
+            if self._stream is None or len(self._stream) < buffer_size:
+                self._stream = bytearray(buffer_size)
+            result = self.readinto(memoryview(self._stream)[:buffer_size], timeout)
+            if result is None:
+                return None
+            size, meta = result
+            return RTMapsSample.from_meta(bytes(self._stream[:size]), meta)
+        if kind == "float64_vector":
+            out = self.vector_buffer(vector_size)
+            result = self.read_float64_vector_into(out, timeout)
+            if result is None:
+                return None
+            count, meta = result
+            return RTMapsSample.from_meta(out[:count].copy(), meta)
+        try:
+            read = getattr(self, _sample_readers[kind])
+        except KeyError:
+            raise RTMapsException("Unsupported sample type '{}'".format(kind))
+        value = read(timeout)
+        if value is None:
+            return None
+        return RTMapsSample(value, self._timestamp.value)
+
+    def read_float64_vector_into(self, out, timeout):
+        """
+        Reads a float64 vector directly into out, a C-contiguous and writeable numpy.float64 array.
+        Returns (number of elements received, maps_ioelt_metadata_t) or None.
+        """
+        if out.dtype != np.float64 or not out.flags.c_contiguous or not out.flags.writeable:
+            raise RTMapsException("Output buffer for {} must be a writeable, C-contiguous float64 array".format(self.name))
+        self._size.value = out.size
+        meta = maps_ioelt_metadata_t()
+        if self._api.maps_read_float64_vector_timeout_meta(self.c_name, int(timeout), out.ctypes.data, self._size_ref, byref(meta)) == 0:
+            return self._size.value, meta
+        return None
+
+    def readinto(self, buffer, timeout):
+        """
+        Reads a stream8 sample directly into buffer: a writeable, C-contiguous bytearray, memoryview, NumPy array
+        or any other object supporting the buffer protocol. Returns (number of bytes received, meta) or None.
+        """
+        size = memoryview(buffer).nbytes
+        try:
+            data = (c_ubyte * size).from_buffer(buffer)
+        except (TypeError, ValueError) as ex:
+            raise RTMapsException("Cannot read {} into this buffer: {}".format(self.name, ex))
+        self._size.value = size
+        meta = maps_ioelt_metadata_t()
+        if self._api.maps_read_stream8_timeout_meta(self.c_name, int(timeout), data, self._size_ref, byref(meta)) == 0:
+            return self._size.value, meta
+        return None
+
+    def read_structures_into(self, out, timeout):
+        """
+        Reads a user structure (vector) directly into out, a writeable, C-contiguous structured array (see
+        structure_dtype). Returns (number of structures received, meta) or None.
+        """
+        if out.dtype.fields is None or not out.flags.c_contiguous or not out.flags.writeable:
+            raise RTMapsException("Output buffer for {} must be a writeable, C-contiguous structured array".format(self.name))
+        self._size.value = out.nbytes
+        meta = maps_ioelt_metadata_t()
+        if self._api.maps_read_user_structure_timeout_meta(self.c_name, int(timeout), out.ctypes.data, self._size_ref, byref(meta)) == 0:
+            return self._size.value // out.dtype.itemsize, meta
+        return None
+
+    def structure_buffer(self, dtype, vector_size):
+        """ The structured array pooled by this handle, reallocated when the dtype changes or more room is needed. """
+        if self._records is None or self._records.dtype != dtype or self._records.size < vector_size:
+            self._records = np.zeros(vector_size, dtype=dtype)
+        return self._records[:vector_size]
+
+    def vector_buffer(self, vector_size=None):
+        """ The float64 array pooled by this handle, grown to hold at least vector_size elements. """
+        if vector_size is None:
+            if self._vector is None:
+                raise RTMapsException("No vector size given and no buffer pooled yet for {}".format(self.name))
+            return self._vector
+        if self._vector is None or self._vector.size < vector_size:
+            self._vector = np.zeros(vector_size, dtype=np.float64)
+        return self._vector[:vector_size]
+
+    def send_int32(self, value):
+        return self._api.maps_send_int32(self.c_name, value)
+
+    def send_int32_ts(self, value, timestamp):
+        return self._api.maps_send_int32_ts(self.c_name, value, timestamp)
+
+    def send_int64_ts(self, value, timestamp):
+        return self._api.maps_send_int64_ts(self.c_name, value, timestamp)
+
+    def send_float64_ts(self, value, timestamp):
+        return self._api.maps_send_float64_ts(self.c_name, value, timestamp)
+
+    def send_batch(self, values, timestamps, chunk_size=65536):
+        """
+        Sends values[i] with timestamps[i] for every i. values is an int32, int64 or float64 array, timestamps an
+        integer array of the same length. Returns (accepted, rejected), the number of samples for which the
+        engine returned success, respectively an error.
+        """
+        values = np.asarray(values)
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        if values.ndim != 1 or values.shape != timestamps.shape:
+            raise RTMapsException("values and timestamps must be one-dimensional arrays of the same length")
+        try:
+            func = getattr(self._api, _batch_senders[values.dtype.type])
+        except KeyError:
+            raise RTMapsException("Type {} is not supported by send_batch. Use int32, int64 or float64".format(values.dtype))
+        rejected = 0
+        for start in range(0, len(values), chunk_size):
+            # The per-sample loop runs in map(): values are converted to Python numbers once per chunk
+            results = list(map(func, repeat(self.c_name), values[start:start + chunk_size].tolist(),
+                               timestamps[start:start + chunk_size].tolist()))
+            rejected += len(results) - results.count(0)
+        return len(values) - rejected, rejected
+
+
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+BLOCK = "block"
+subscription_policies = (DROP_OLDEST, DROP_NEWEST, BLOCK)
+
+
+class RTMapsSubscription(object):
+    """
+    Iterator over the samples of an output, fed by a dedicated reader thread.
+
+    The reader thread blocks in the maps_read_*_timeout calls (which release the GIL) and pushes RTMapsSample
+    records into a ring buffer of maxsize elements. When the buffer is full, policy decides what happens:
+    DROP_OLDEST discards the oldest buffered sample, DROP_NEWEST discards the sample just read, BLOCK makes the
+    reader wait for the consumer (the engine FIFO then absorbs the backlog). Discarded samples are counted in dropped.
+
+        with maps.subscribe("Lidar_1", "points", "float64_vector", size=10000) as subscription:
+            for sample in subscription:
+                process(sample.value)
+    """
+    def __init__(self, read, name, maxsize=1024, policy=DROP_OLDEST):
+        if policy not in subscription_policies:
+            raise RTMapsException("{} is not a valid policy. Valid policies are: {}".format(policy, subscription_policies))
+        if maxsize < 1:
+            raise RTMapsException("Subscription buffer size must be at least 1")
+        self.name = name
+        self.policy = policy
+        self.maxsize = maxsize
+        self.received = 0
+        self.dropped = 0
+        self.delivered = 0
+        self._read = read
+        self._buffer = deque()
+        self._condition = threading.Condition()
+        self._closed = False
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name="RTMapsSubscription({})".format(name), daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def close(self, timeout=None):
+        """ Stops the reader thread. Samples already buffered can still be consumed. """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        if self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        sample = self.get()
+        if sample is None:
+            raise StopIteration
+        return sample
+
+    def __len__(self):
+        with self._condition:
+            return len(self._buffer)
+
+    def get(self, timeout=None):
+        """
+        Returns the next sample, waiting at most timeout seconds (forever if None). Returns None on timeout, or
+        once the subscription is closed and drained. Re-raises an exception that stopped the reader thread.
+        """
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._buffer or self._closed, timeout):
+                return None
+            if self._buffer:
+                sample = self._buffer.popleft()
+                self.delivered += 1
+                self._condition.notify_all()
+                return sample
+            if self._error is not None:
+                error, self._error = self._error, None
+                raise error
+            return None
+
+    def _run(self):
+        try:
+            while not self._closed:
+                sample = self._read()
+                if sample is not None:
+                    self._push(sample)
+        except Exception as ex:
+            with self._condition:
+                self._error = ex
+        finally:
+            with self._condition:
+                self._closed = True
+                self._condition.notify_all()
+
+    def _push(self, sample):
+        with self._condition:
+            self.received += 1
+            if len(self._buffer) >= self.maxsize:
+                if self.policy == DROP_OLDEST:
+                    self._buffer.popleft()
+                    self.dropped += 1
+                elif self.policy == DROP_NEWEST:
+                    self.dropped += 1
+                    return
+                else:
+                    self._condition.wait_for(lambda: len(self._buffer) < self.maxsize or self._closed)
+                    if self._closed:
+                        self.dropped += 1
+                        return
+            self._buffer.append(sample)
+            self._condition.notify_all()
+
+
+class PropertyWatch(object):
+    """ A property watched by a PropertyWatcher, see RTMapsWrapper.watch(). value is the last value read. """
+    __slots__ = ("name", "period", "value", "active", "_read", "_callback", "_watcher")
+
+    def __init__(self, watcher, name, read, callback, period):
+        self.name = name
+        self.period = period
+        self.value = None
+        self.active = True
+        self._read = read
+        self._callback = callback
+        self._watcher = watcher
+
+    def __repr__(self):
+        return "PropertyWatch({!r}, period={})".format(self.name, self.period)
+
+    def cancel(self):
+        self._watcher.remove(self)
+
+
+class PropertyWatcher(object):
+    """
+    Polls watched properties from a single scheduler thread. Watches sharing a period form a group that is read
+    in one tight batch; the callbacks are then called, in the scheduler thread, for the values that changed. A
+    group that falls behind skips the missed periods instead of bursting.
+    """
+    def __init__(self):
+        self._groups = dict()  # period -> [PropertyWatch]
+        self._due = dict()  # period -> time.monotonic() of the next read
+        self._condition = threading.Condition()
+        self._thread = None
+        self._stopped = False
+
+    def add(self, watch):
+        with self._condition:
+            if watch.period not in self._groups:
+                self._groups[watch.period] = list()
+                self._due[watch.period] = time.monotonic()
+            self._groups[watch.period].append(watch)
+            if self._thread is None:
+                self._stopped = False
+                self._thread = threading.Thread(target=self._run, name="RTMapsPropertyWatcher", daemon=True)
+                self._thread.start()
+            self._condition.notify_all()
+        return watch
+
+    def remove(self, watch):
+        with self._condition:
+            watch.active = False
+            group = self._groups.get(watch.period, [])
+            if watch in group:
+                group.remove(watch)
+            if not group:
+                self._groups.pop(watch.period, None)
+                self._due.pop(watch.period, None)
+
+    def watches(self):
+        with self._condition:
+            return [watch for group in self._groups.values() for watch in group]
+
+    def stop(self):
+        """ Cancels every watch and stops the scheduler thread. """
+        with self._condition:
+            for group in self._groups.values():
+                for watch in group:
+                    watch.active = False
+            self._groups.clear()
+            self._due.clear()
+            self._stopped = True
+            thread, self._thread = self._thread, None
+            self._condition.notify_all()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    if self._stopped:
+                        return
+                    if not self._due:
+                        self._condition.wait()
+                        continue
+                    period, due = min(self._due.items(), key=lambda item: item[1])
+                    now = time.monotonic()
+                    if due <= now:
+                        break
+                    self._condition.wait(due - now)
+                self._due[period] = max(due + period, now)
+                watches = list(self._groups[period])
+            values = [watch._read() for watch in watches]
+            for watch, value in zip(watches, values):
+                if watch.active and value != watch.value:
+                    watch.value = value
+                    try:
+                        watch._callback(watch.name, value)
+                    except Exception:
+                        logging.exception("Callback of {} failed".format(watch.name))
+
+
+class FramePool(object):
+    """
+    A ring of count preallocated buffers of frame_size bytes, handed out in turn by next(). The consumer may keep
+    up to count - 1 frames while the next ones are being read. frame_factory builds each buffer (bytearray by
+    default; use e.g. lambda size: numpy.empty(size, numpy.uint8) for NumPy frames).
+    """
+    def __init__(self, frame_size, count=4, frame_factory=bytearray):
+        if count < 1:
+            raise RTMapsException("A frame pool needs at least one buffer")
+        self.frame_size = frame_size
+        self.frames = [frame_factory(frame_size) for _ in range(count)]
+        self._next = 0
+
+    def __len__(self):
+        return len(self.frames)
+
+    def next(self):
+        frame = self.frames[self._next]
+        self._next = (self._next + 1) % len(self.frames)
+        return frame
+
+
+class CommandLog(object):
+    """
+    The successful RTMaps commands, kept as a model of the diagram state rather than as a history.
+
+    A property assignment replaces the previous assignment of the same property (keeping its position), a kill
+    drops every command referring to the component (and cancels its addition if it was added through the log),
+    a -X- cancels the matching ->, a repeated action is moved to the end of the log with its number of executions
+    (replayed that many times) and other commands are recorded once. Iterating over the log yields the minimal
+    script equivalent to the commands appended, and memory is bounded by the size of the diagram.
+    """
+    def __init__(self):
+        self._entries = dict()  # key -> command, in insertion order
+        self._action_counts = dict()  # ("action", command) -> number of executions
+        self._added = set()  # components added through this log
+        self._sequence = 0  # makes the keys of the kills unique
+
+    def __iter__(self):
+        commands = list()
+        for key, command in list(self._entries.items()):
+            commands.extend(repeat(command, self._action_counts.get(key, 1)))
+        return iter(commands)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        self._entries.clear()
+        self._action_counts.clear()
+        self._added.clear()
+        self._sequence = 0
+
+    def append(self, command):
+        command = command.strip()
+        tokens = command.split()
+        if not tokens:
+            return
+        target, assignment, value = command.partition("=")
+        target = target.strip()
+        if assignment and target and not any(char.isspace() for char in target):
+            self._entries[("set", target)] = command
+        elif " -> " in command:
+            self._entries[("connect", command)] = command
+        elif " -X- " in command:
+            connection = ("connect", command.replace(" -X- ", " -> ", 1))
+            if connection in self._entries:
+                del self._entries[connection]
+            else:
+                self._entries[("command", command)] = command
+        elif tokens[0] == "kill" and len(tokens) == 2:
+            added = tokens[1] in self._added
+            self._forget_component(tokens[1])
+            if not added:  # e.g. loaded from a diagram: the kill itself is needed
+                self._entries[("kill", self._next_sequence())] = command
+        elif tokens[0] == "set_location" and len(tokens) >= 2:
+            self._entries[("location", tokens[1])] = command
+        elif len(tokens) == 2 and not any(char in command for char in invalid_name_characters):
+            self._entries[("add", tokens[1])] = command
+            self._added.add(tokens[1])
+        elif len(tokens) == 1 and command.count(".") == 1:
+            key = ("action", command)
+            self._entries.pop(key, None)
+            self._entries[key] = command
+            self._action_counts[key] = self._action_counts.get(key, 0) + 1
+        else:
+            self._entries[("command", command)] = command
+
+    def _next_sequence(self):
+        self._sequence += 1
+        return self._sequence
+
+    def _forget_component(self, component_id):
+        self._added.discard(component_id)
+        prefix = component_id + "."
+        for key, command in list(self._entries.items()):
+            kind, subject = key
+            if kind in ("add", "location") and subject == component_id:
+                del self._entries[key]
+            elif kind == "set" and subject.startswith(prefix):
+                del self._entries[key]
+            elif kind == "connect" and any(part.strip().startswith(prefix) for part in subject.split(" -> ")):
+                del self._entries[key]
+            elif kind in ("action", "command") and command.startswith(prefix):
+                del self._entries[key]
+                self._action_counts.pop(key, None)
+
+
+_structure_dtypes = dict()
+
+
+def structure_dtype(structure_type):
+    """
+    Returns the NumPy structured dtype with the same layout (field offsets, nested structures, arrays, padding
+    and size) as the ctypes Structure structure_type. The translation is done once per type.
+    """
+    try:
+        return _structure_dtypes[structure_type]
+    except KeyError:
+        pass
+    try:
+        dtype = np.dtype(structure_type)
+    except TypeError as ex:  # e.g. bitfields
+        raise RTMapsException("Structure {} has no NumPy equivalent: {}".format(structure_type.__name__, ex))
+    if dtype.itemsize != sizeof(structure_type):
+        raise RTMapsException("Layout of structure {} could not be reproduced by NumPy".format(structure_type.__name__))
+    _structure_dtypes[structure_type] = dtype
+    return dtype
+
+
+_batch_senders = {
+    np.int32: "maps_send_int32_ts",
+    np.int64: "maps_send_int64_ts",
+    np.float64: "maps_send_float64_ts",
+}
+
+_sample_readers = {
+    "int32": "read_int32_timeout",
+    "int64": "read_int64_timeout",
+    "float64": "read_float64_timeout",
+    "text": "read_text_timeout",
+}
+sample_kinds = ("int32", "int64", "float64", "text", "float64_vector", "stream8")
+
+
 class RTMapsWrapper(Singleton):
     """
     A very basic wrapper as received from Intempora with small improvements. It is intended as a direct interface
@@ -79,35 +722,50 @@ class RTMapsWrapper(Singleton):
     REPORT_WARNING = 1
     REPORT_ERROR = 2
 
-    def __init__(self, *args):
-
-        if sys.platform == "linux" or sys.platform == "linux2":
-            self.rtmaps_install_path = "/opt/rtmaps"
-            rtmaps_library_filename = os.path.join(self.rtmaps_install_path, "lib", "librtmaps.so")
-        elif sys.platform == "win32":
-            self.rtmaps_install_path = os.environ.get(RTMapsDefaults.rtmaps_install_variable)
-            rtmaps_library_filename = os.path.join(self.rtmaps_install_path, "bin", "rtmaps.dll")
-            os.environ['PATH'] = os.path.join(self.rtmaps_install_path, "bin") + os.pathsep + os.environ['PATH']
-        else:
-            raise AssertionError("Platform '{}' not supported by RTMapsPlugin.".format(sys.platform))
-
+    def __init__(self, *args, backend=None):
+        """
+        args are the engine command line arguments. backend replaces librtmaps.so/rtmaps.dll by an object providing
+        the same maps_* functions (with the same arguments), e.g. the SimulatedEngine of rtmaps_simulation.
+        """
         n_args = len(args)
         argc = c_int(n_args)
         argv = (c_char_p * n_args)()
         for i in range(n_args):
             argv[i] = args[i].encode('utf-8')
 
-        try:
-            self.lib = cdll.LoadLibrary(rtmaps_library_filename)
+        if backend is not None:
+            self.rtmaps_install_path = getattr(backend, "rtmaps_install_path", "")
+            self.lib = backend
             self.lib.maps_init(argc, byref(argv))
-
-        except:
-            logging.error("Failed to load RTMaps library. "
-                          "Please check environment variable '{}'!".format(RTMapsDefaults.rtmaps_install_variable))
-            self.lib = None
-            raise
-
-        self._command_log = list()
+            self._api = backend
+        else:
+            if sys.platform == "linux" or sys.platform == "linux2":
+                self.rtmaps_install_path = "/opt/rtmaps"
+                rtmaps_library_filename = os.path.join(self.rtmaps_install_path, "lib", "librtmaps.so")
+            elif sys.platform == "win32":
+                self.rtmaps_install_path = os.environ.get(RTMapsDefaults.rtmaps_install_variable)
+                rtmaps_library_filename = os.path.join(self.rtmaps_install_path, "bin", "rtmaps.dll")
+                os.environ['PATH'] = os.path.join(self.rtmaps_install_path, "bin") + os.pathsep + os.environ['PATH']
+            else:
+                raise AssertionError("Platform '{}' not supported by RTMapsPlugin.".format(sys.platform))
+            rtmaps_library_filename = os.environ.get(RTMapsDefaults.rtmaps_library_variable, rtmaps_library_filename)
+
+            try:
+                self.lib = cdll.LoadLibrary(rtmaps_library_filename)
+                self.lib.maps_init(argc, byref(argv))
+
+            except:
+                logging.error("Failed to load RTMaps library. "
+                              "Please check environment variable '{}'!".format(RTMapsDefaults.rtmaps_install_variable))
+                self.lib = None
+                raise
+
+            self._api = _MapsFunctionTable(self.lib)
+        self._ports = dict()
+        self._command_log = CommandLog()
+        self._property_watcher = None
+        self._string_buffers = threading.local()  # see _get_string
+        self._thread_ports = threading.local()  # see _thread_port
 
     def __del__(self):
         if self.lib:
@@ -123,11 +781,11 @@ class RTMapsWrapper(Singleton):
         self._command_log.clear()
         self.lib.maps_reset()
 
-    def parse(self, command):
+    def parse(self, command, add_to_command_log=True):
         response = self.lib.maps_parse(command.encode('utf-8'))
         if response != 0:
             raise RTMapsException("Error while parsing command '{}'".format(command))
-        else:
+        elif add_to_command_log:
             self._command_log.append(command)
 
     def register_package(self, package_name, package_folder=""):
@@ -163,216 +821,155 @@ class RTMapsWrapper(Singleton):
     def pause(self):
         self.lib.maps_pause()
 
+    def port(self, name):
+        """ Returns the (interned) RTMapsPort handle for the input or output "Component.port". """
+        try:
+            return self._ports[name]
+        except KeyError:
+            handle = self._ports[name] = RTMapsPort(self._api, name)
+            return handle
+
+    def _thread_port(self, name):
+        """ RTMapsPort handle of the calling thread, whose out-parameters no other thread writes. """
+        ports = getattr(self._thread_ports, "ports", None)
+        if ports is None:
+            ports = self._thread_ports.ports = dict()
+        try:
+            return ports[name]
+        except KeyError:
+            handle = ports[name] = RTMapsPort(self._api, name)
+            return handle
+
     def get_current_time(self):
-        func = self.lib.maps_get_current_time
-        func.argtypes = [POINTER(c_long)]
-        current_time = c_long()
-        func(byref(current_time))
+        current_time = c_int64()
+        self._api.maps_get_current_time(byref(current_time))
         return current_time.value
 
     def get_integer_property(self, name):
-        func = self.lib.maps_get_integer_property
-        func.argtypes = [c_char_p, POINTER(c_long)]
-        func.restype = c_int
-
-        property_name = name.encode('utf-8')
         property_value = c_long()
-        if func(property_name, byref(property_value)) == 0:
+        if self._api.maps_get_integer_property(name.encode('utf-8'), byref(property_value)) == 0:
             return property_value.value
         else:
             return None
         
     def get_float_property(self, name):
-        func = self.lib.maps_get_float_property
-        func.argtypes = [c_char_p, POINTER(c_double)]
-        func.restype = c_int
-
-        property_name = name.encode('utf-8')
         property_value = c_double()
-        if func(property_name, byref(property_value)) == 0:
+        if self._api.maps_get_float_property(name.encode('utf-8'), byref(property_value)) == 0:
             return property_value.value
         else:
             return None
         
 
     def get_string_property(self, name):
-        size = c_int()
-        self.lib.maps_get_string_property(name.encode('utf-8'), None, byref(size))
-        buffer = create_string_buffer(size.value)
-        self.lib.maps_get_string_property(name.encode('utf-8'), buffer, byref(size))
-        return buffer.value.decode('utf-8')
+        return self._get_string(self._api.maps_get_string_property, name)
 
     def get_enum_property(self, name):
-        size = c_int()
-        self.lib.maps_get_enum_property(name.encode('utf-8'), None, byref(size))
-        buffer = create_string_buffer(size.value)
-        self.lib.maps_get_enum_property(name.encode('utf-8'), buffer, byref(size))
-        return buffer.value.decode('utf-8')
+        return self._get_string(self._api.maps_get_enum_property, name)
 
     def send_int32(self, name, value):
-        func = self.lib.maps_send_int32
-        func.argtypes = [c_char_p, c_int32]
-        func.restype = c_int
-        
-        input_name = name.encode('utf-8')
-        input_value = c_int32(value)
-
-        return func(input_name, input_value)
+        return self._thread_port(name).send_int32(value)
 
     def send_int32_ts(self, name, value, timestamp):
-        func = self.lib.maps_send_int32_ts
-        func.argtypes = [c_char_p, c_int32, c_int64]
-        func.restype = c_int
-        
-        input_name = name.encode('utf-8')
-        input_value = c_int32(value)
-        input_timestamp = c_int64(timestamp)
-
-        return func(input_name, input_value, input_timestamp)
+        return self._thread_port(name).send_int32_ts(value, timestamp)
 
     def send_int64_ts(self, name, value, timestamp):
-        func = self.lib.maps_send_int32_ts
-        func.argtypes = [c_char_p, c_int64, c_int64]
-        func.restype = c_int
-        
-        input_name = name.encode('utf-8')
-        input_value = c_int64(value)
-        input_timestamp = c_int64(timestamp)
+        return self._thread_port(name).send_int64_ts(value, timestamp)
+
+    def send_float64_ts(self, name, value, timestamp):
+        return self._thread_port(name).send_float64_ts(value, timestamp)
 
-        return func(input_name, input_value, input_timestamp)
+    def send_batch(self, name, values, timestamps):
+        return self._thread_port(name).send_batch(values, timestamps)
 
     def read_int32(self, name, wait_for_data):
-        func = self.lib.maps_read_int32
-        func.argtypes = [c_char_p, c_int, POINTER(c_long), POINTER(c_longlong)]
-        func.restype = c_int
-        
-        output_name = name.encode('utf-8')
-        output_value = c_long()
-        timestamp = c_longlong()
-        wait_for_data_ = c_int(int(wait_for_data))
+        return self._thread_port(name).read_int32(wait_for_data)
 
-        if func(output_name, wait_for_data_, byref(output_value), byref(timestamp)) == 0:
-            return output_value.value
-        else:
-            return None
     def read_int64(self, name, wait_for_data):
-        func = self.lib.maps_read_int64
-        func.argtypes = [c_char_p, c_int, POINTER(c_longlong), POINTER(c_longlong)]
-        func.restype = c_int
-        
-        output_name = name.encode('utf-8')
-        output_value = c_longlong()
-        timestamp = c_longlong()
-        wait_for_data_ = c_int(int(wait_for_data))
+        return self._thread_port(name).read_int64(wait_for_data)
 
-        if func(output_name, wait_for_data_, byref(output_value), byref(timestamp)) == 0:
-            return output_value.value
-        else:
-            return None
-
-    
     def read_int32_timeout(self, name, timeout):
-        func = self.lib.maps_read_int32_timeout
-        func.argtypes = [c_char_p, c_int64, POINTER(c_long), POINTER(c_longlong)]
-        func.restype = c_int
-        
-        output_name = name.encode('utf-8')
-        output_value = c_long()
-        timestamp = c_longlong()
-        timeout_ = c_int64(int64(timeout))
-
-        result = func(output_name, timeout_, byref(output_value), byref(timestamp))
-        if result == 0:
-            return output_value.value
-        else:
-            return None
+        return self._thread_port(name).read_int32_timeout(timeout)
 
     def read_int64_timeout(self, name, timeout):
-        func = self.lib.maps_read_int64_timeout
-        func.argtypes = [c_char_p, c_int64, POINTER(c_long), POINTER(c_longlong)]
-        func.restype = c_int
-        
-        output_name = name.encode('utf-8')
-        output_value = c_long()
-        timestamp = c_longlong()
-        timeout_ = c_int64(int64(timeout))
-
-        result = func(output_name, timeout_, byref(output_value), byref(timestamp))
-        if result == 0:
-            return output_value.value
-        else:
-            return None
+        return self._thread_port(name).read_int64_timeout(timeout)
 
     def read_float64_timeout(self, name, timeout):
-        func = self.lib.maps_read_float64_timeout
-        func.argtypes = [c_char_p, c_int64, POINTER(c_double), POINTER(c_longlong)]
-        func.restype = c_int
-        
-        output_name = name.encode('utf-8')
-        output_value = c_double()
-        timestamp = c_longlong()
-        timeout_ = c_int64(int64(timeout))
-
-        result = func(output_name, timeout_, byref(output_value), byref(timestamp))
-        if result == 0:
-            return output_value.value
-        else:
-            return None
+        return self._thread_port(name).read_float64_timeout(timeout)
 
     def read_text_timeout(self, component_dot_output, timeout, text_buffer_size=1024):
-        func = self.lib.maps_read_text_timeout
-        func.argtypes = [c_char_p, c_int64, c_char_p, POINTER(c_int), POINTER(c_int64)]
-        func.restype = c_int
+        return self._thread_port(component_dot_output).read_text_timeout(timeout, text_buffer_size)
 
-        text_buffer = create_string_buffer(text_buffer_size)
-
-        output_name = component_dot_output.encode("utf-8")
-        timeout_ = c_int64(int64(timeout))
-        dataSize = c_int(text_buffer_size)
-        timestamp = c_int64()
-
-        result = func(
-            output_name, timeout_, text_buffer, byref(dataSize), byref(timestamp)
-        )
-        if result == 0:
-            text = text_buffer.value.decode("utf-8")
-            return text
+    def read_float64_vector_timeout_meta(self, name, vector_size, timeout):
+        output_vector = np.zeros(vector_size, dtype=np.float64)
+        if self._thread_port(name).read_float64_vector_into(output_vector, timeout) is not None:
+            return output_vector.tolist()
         else:
             return None
 
-    def read_float64_vector_timeout_meta(self, name, vector_size, timeout):
-        class vector_of_doubles(Structure):
-            _fields_ = [(f"elem{i}", c_double) for i in range(vector_size)] # vector type is dynamically created based on parameter vector_size
-
-        func = self.lib.maps_read_float64_vector_timeout_meta
-        func.argtypes = [c_char_p, c_int64, POINTER(vector_of_doubles), POINTER(c_int), POINTER(maps_ioelt_metadata_t)]
-        func.restype = c_int
-        
-        output_name = name.encode('utf-8')
-        timeout_ = c_int64(int64(timeout))
-        output_vector = vector_of_doubles()
-        vector_size_ = c_int(vector_size)
-        meta = maps_ioelt_metadata_t()
-
-        result = func(output_name, timeout_, byref(output_vector), byref(vector_size_), byref(meta))
-        if result == 0:
-            return [getattr(output_vector, a[0]) for a in output_vector._fields_]
-        else:
+    def read_float64_array_timeout_meta(self, name, timeout, out=None, vector_size=None):
+        """
+        Zero-copy variant of read_float64_vector_timeout_meta. The vector is received directly into out, a float64
+        numpy array, or into the array pooled by the port handle (see RTMapsPort.vector_buffer) when out is None.
+        Returns (out[:count], meta), count being the number of elements received, or None. A pooled array is
+        overwritten by the next read on the same port from the same thread.
+        """
+        port = self._thread_port(name)
+        if out is None:
+            out = port.vector_buffer(vector_size)
+        result = port.read_float64_vector_into(out, timeout)
+        if result is None:
             return None
+        count, meta = result
+        return out[:count], meta
+
+    def read_sample(self, name, kind, timeout, size=None):
+        """
+        Reads the output name and returns an RTMapsSample carrying the value and its timing, see
+        RTMapsPort.read_sample. size is the number of elements of a vector, or the buffer size in bytes of a stream.
+        """
+        return self._thread_port(name).read_sample(kind, timeout, size)
+
+    def subscribe(self, name, kind="float64", maxsize=1024, policy=DROP_OLDEST, size=None, poll_timeout=100000):
+        """
+        Starts an RTMapsSubscription reading samples of the given kind (see read_sample) from the output name.
+        poll_timeout (in microseconds) bounds each blocking read, so that close() returns promptly.
+        """
+        if kind not in sample_kinds:
+            raise RTMapsException("{} is not a valid sample type. Valid types are: {}".format(kind, sample_kinds))
+        port = RTMapsPort(self._api, name)  # own handle: the out-parameters belong to the reader thread
+        read = lambda: port.read_sample(kind, poll_timeout, size)
+        return RTMapsSubscription(read, name, maxsize, policy).start()
+
+    def watch(self, name, callback, period=0.1, kind="integer"):
+        """
+        Calls callback(name, value) each time the "integer", "float", "string" or "enum" property name changes,
+        polling it every period seconds from the shared PropertyWatcher thread. The first value read counts as a
+        change. Returns the PropertyWatch; call its cancel() method to stop watching.
+        """
+        try:
+            getter = {
+                "integer": RTMapsWrapper.get_integer_property,
+                "float": RTMapsWrapper.get_float_property,
+                "string": RTMapsWrapper.get_string_property,
+                "enum": RTMapsWrapper.get_enum_property,
+            }[kind]
+        except KeyError:
+            raise RTMapsException("{} is not a valid property type. Valid types are: integer, float, string, enum".format(kind))
+        if period <= 0:
+            raise RTMapsException("Watch period must be positive")
+        if self._property_watcher is None:
+            self._property_watcher = PropertyWatcher()
+        watcher = self._property_watcher
+        return watcher.add(PropertyWatch(watcher, name, partial(getter, self, name), callback, period))
 
     def read_user_structure_timeout_meta(self, component_dot_output, custom_structure_type, timeout):
-        func = self.lib.maps_read_user_structure_timeout_meta
-        func.argtypes = [c_char_p, c_int64, c_void_p, POINTER(c_int), POINTER(maps_ioelt_metadata_t)]
-        func.restype = c_int
-        
         custom_structure = custom_structure_type()
 
-        output_name = component_dot_output.encode('utf-8')
-        timeout_ = c_int64(int64(timeout))
         dataSize = c_int(sizeof(custom_structure))
         meta = maps_ioelt_metadata_t()
 
-        result = func(output_name, timeout_, byref(custom_structure), byref(dataSize), byref(meta))
+        result = self._api.maps_read_user_structure_timeout_meta(
+            self._thread_port(component_dot_output).c_name, int(timeout), byref(custom_structure), byref(dataSize), byref(meta))
         if result == 0:
             return custom_structure
         else:
@@ -380,87 +977,110 @@ class RTMapsWrapper(Singleton):
 
 
     def read_user_structure_vector_timeout_meta(self, component_dot_output, custom_structure_type, vector_size, timeout):
-        func = self.lib.maps_read_user_structure_timeout_meta
-        func.argtypes = [c_char_p, c_int64, c_void_p, POINTER(c_int), POINTER(maps_ioelt_metadata_t)]
-        func.restype = c_int
-        
         buffer_type = c_int8 * sizeof(custom_structure_type) * vector_size
         buffer = buffer_type()
 
-        output_name = component_dot_output.encode('utf-8')
-        timeout_ = c_int64(int64(timeout))
         dataSize = c_int(sizeof(buffer))
         meta = maps_ioelt_metadata_t()
 
-        result = func(output_name, timeout_, byref(buffer), byref(dataSize), byref(meta))
+        result = self._api.maps_read_user_structure_timeout_meta(
+            self._thread_port(component_dot_output).c_name, int(timeout), byref(buffer), byref(dataSize), byref(meta))
         if result == 0:
             return [custom_structure_type.from_buffer(buffer, i * sizeof(custom_structure_type)) for i in range(vector_size)]
         else:
             return None
 
-    def read_stream8_timeout_meta(self, component_dot_output, timeout, buffer_size = 1024):
-        func = self.lib.maps_read_stream8_timeout_meta
-        func.argtypes = [c_char_p, c_int64, POINTER(c_ubyte), POINTER(c_int), POINTER(maps_ioelt_metadata_t)]
-        func.restype = c_int
-        
-        buffer_type = c_ubyte * buffer_size
-        buffer = buffer_type()
-
-        output_name = component_dot_output.encode('utf-8')
-        timeout_ = c_int64(int64(timeout))
-        dataSize = c_int(buffer_size)
-        meta = maps_ioelt_metadata_t()
+    def read_user_structure_array_timeout_meta(self, component_dot_output, custom_structure_type, vector_size, timeout, out=None):
+        """
+        NumPy variant of read_user_structure_vector_timeout_meta. The structures are received directly into out,
+        a structured array of structure_dtype(custom_structure_type), or into the array pooled by the port handle
+        when out is None (overwritten by the next read). Returns (out[:count], meta), count being the number of
+        structures received, or None. Fields are columns: array["x"] is a view over the x field of every element.
+        """
+        port = self._thread_port(component_dot_output)
+        if out is None:
+            out = port.structure_buffer(structure_dtype(custom_structure_type), vector_size)
+        result = port.read_structures_into(out, timeout)
+        if result is None:
+            return None
+        count, meta = result
+        return out[:count], meta
 
-        result = func(output_name, timeout_, buffer, byref(dataSize), byref(meta))
-        if result == 0:
-            return bytes(buffer[:dataSize.value])
+    def read_stream8_timeout_meta(self, component_dot_output, timeout, buffer_size = 1024):
+        buffer = bytearray(buffer_size)
+        result = self._thread_port(component_dot_output).readinto(buffer, timeout)
+        if result is not None:
+            return bytes(memoryview(buffer)[:result[0]])
         else:
             return None
 
+    def readinto(self, name, buffer, timeout):
+        """ Reads a stream8 sample of the output name in place into buffer, see RTMapsPort.readinto. """
+        return self._thread_port(name).readinto(buffer, timeout)
+
+    def read_frame(self, name, pool, timeout):
+        """
+        Reads a stream8 sample into the next buffer of the FramePool pool. Returns (memoryview of the bytes
+        received, meta) or None. The view stays valid until the pool hands out the same buffer again.
+        """
+        frame = pool.next()
+        result = self._thread_port(name).readinto(frame, timeout)
+        if result is None:
+            return None
+        size, meta = result
+        return memoryview(frame)[:size], meta
+
     def get_action_names_for_component(self, component):
-        size = c_int()
-        self.lib.maps_get_action_names_for_component(component.encode('utf-8'), None, byref(size))
-        buffer = create_string_buffer(size.value)
-        self.lib.maps_get_action_names_for_component(component.encode('utf-8'), buffer, byref(size))
-        return buffer.value.decode('utf-8').split('|')
+        return self._get_string(self._api.maps_get_action_names_for_component, component).split('|')
 
     def get_output_names_for_component(self, component):
-        size = c_int()
-        self.lib.maps_get_output_names_for_component(component.encode('utf-8'), None, byref(size))
-        buffer = create_string_buffer(size.value)
-        self.lib.maps_get_output_names_for_component(component.encode('utf-8'), buffer, byref(size))
-        return buffer.value.decode('utf-8').split('|')
+        return self._get_string(self._api.maps_get_output_names_for_component, component).split('|')
             
     def get_input_names_for_component(self, component):
-        size = c_int()
-        self.lib.maps_get_input_names_for_component(component.encode('utf-8'), None, byref(size))
-        buffer = create_string_buffer(size.value)
-        self.lib.maps_get_input_names_for_component(component.encode('utf-8'), buffer, byref(size))
-        return buffer.value.decode('utf-8').split('|')
+        return self._get_string(self._api.maps_get_input_names_for_component, component).split('|')
 
     def get_property_names_for_component(self, component):
-        size = c_int()
-        self.lib.maps_get_property_names_for_component(component.encode('utf-8'), None, byref(size))
-        buffer = create_string_buffer(size.value)
-        self.lib.maps_get_property_names_for_component(component.encode('utf-8'), buffer, byref(size))
-        return buffer.value.decode('utf-8').split('|')
-    def is_running(self):
-        func = self.lib.maps_is_running
-        func.argtypes = [POINTER(c_int)] # MAPS_BOOL is an int
-        func.restype = c_int
+        return self._get_string(self._api.maps_get_property_names_for_component, component).split('|')
+
+    def _get_string(self, func, name):
+        """
+        Queries a variable-length string (property value or names of a component). The buffer used for each
+        (function, name) is kept per thread, so the common case is a single call into that buffer. The size is
+        probed (with a None buffer, as librtmaps expects) when unknown, when the engine reports a larger size, or
+        when the result fills the buffer.
+        """
+        pool = getattr(self._string_buffers, "pool", None)
+        if pool is None:
+            pool = self._string_buffers.pool = dict()
+        key = (func.__name__, name)  # not id(func): a backend object returns a new bound method on each access
+        entry = pool.get(key)
+        if entry is not None:
+            encoded_name, buffer, size = entry
+            size.value = len(buffer)
+            func(encoded_name, buffer, byref(size))
+            value = buffer.value
+            if size.value <= len(buffer) and len(value) < len(buffer) - 1:
+                return value.decode('utf-8')
+        else:
+            encoded_name, size = name.encode('utf-8'), c_int()
+        func(encoded_name, None, byref(size))
+        buffer = create_string_buffer(max(2 * size.value, 64))  # headroom, so that a full buffer means truncation
+        pool[key] = (encoded_name, buffer, size)
+        size.value = len(buffer)
+        func(encoded_name, buffer, byref(size))
+        return buffer.value.decode('utf-8')
 
+    def is_running(self):
         property_value = c_int()
-        if func(byref(property_value)) == 0:
+        if self._api.maps_is_running(byref(property_value)) == 0:
             return bool(property_value.value)
 
     def is_paused(self):
-        func = self.lib.maps_is_paused
-        func.argtypes = [POINTER(c_int)] # MAPS_BOOL is an int
-        func.restype = c_int
-
         property_value = c_int()
-        if func(byref(property_value)) == 0:
+        if self._api.maps_is_paused(byref(property_value)) == 0:
             return bool(property_value.value)
+
+
 class RTMapsAbstraction(RTMapsWrapper):
     """ 
     A more abstract interface to the original RTMapsWrapper (yes, this name sucks but I could not think
@@ -469,13 +1089,17 @@ class RTMapsAbstraction(RTMapsWrapper):
     It provides more convience features as it keeps track of all components added to the diagram. Furthermore, it checks if properties, inports or 
     outports do exists before executing the underlying commands. This class is not complete yet, feel free to add more features. 
     """
-    def __init__(self):
+    def __init__(self, backend=None):
         self._enable_checks = True
         self._components = set()
+        self._introspection = dict()  # component id -> {kind: frozenset of "component.name"}
+        self._seeded_introspection = set()  # (component id, kind) of the cached names read from a .rtd, not the engine
+        self._enum_domains = dict()  # (component id, property) -> tuple of valid values, None if not an enum
+        self.diagram_index = DiagramIndex(None)  # model of the current diagram, see parse()
         if sys.platform == "linux" or sys.platform == "linux2":
-            super(RTMapsAbstraction, self).__init__("--console", "--no-x11")
+            super(RTMapsAbstraction, self).__init__("--console", "--no-x11", backend=backend)
         elif sys.platform == "win32":
-            super(RTMapsAbstraction, self).__init__("--console")
+            super(RTMapsAbstraction, self).__init__("--console", backend=backend)
 
     def add_component(self, component_type: str, component_id: str, xpos = None, ypos = None, zpos = 0):
         if self._enable_checks:
@@ -484,6 +1108,7 @@ class RTMapsAbstraction(RTMapsWrapper):
         command = "{} {}".format(component_type, component_id)
         self.parse(command)
         self._components.add(component_id)
+        self.invalidate_introspection(component_id)
         if (xpos is not None) and (ypos is not None):
             command = "set_location {} {:d} {:d} {:d}".format(component_id, int(xpos), int(ypos), int(zpos))
             self.parse(command)
@@ -492,6 +1117,7 @@ class RTMapsAbstraction(RTMapsWrapper):
         command = "kill {}".format(component_id)
         self.parse(command)
         self._components.remove(component_id)
+        self.invalidate_introspection(component_id)
     def connect_components(self, producer_id, producer_outport, consumer_id, consumer_inport):
         self.check_component_availability(producer_id)
         self.check_component_availability(consumer_id)
@@ -540,15 +1166,19 @@ class RTMapsAbstraction(RTMapsWrapper):
         command = "{}.{}.{} = {}".format(component_id, output_name, property_name, RTMapsAbstraction.format_value(value))
         self.parse(command)
 
+    def batch(self):
+        """ Returns a DiagramBatch collecting diagram commands to validate and submit together. """
+        return DiagramBatch(self)
+
     def print_rtm_script(self):
         for line in self._command_log:
             print(line)
     def write_rtm_script(self, path, overwrite=True):
         if not overwrite and os.path.isfile(path):
             raise RTMapsException("File {} already exists".format(path))
+        lines = list(self._command_log)
         with open(path, 'w') as file:
-            for line in self._command_log:
-                print(line, file=file)
+            file.write("\n".join(lines) + "\n" if lines else "")
     
     def export_rtd(self, file_path: str, overwrite: bool):
         command = "exportdiagramas <<{}>>".format(file_path)
@@ -558,31 +1188,31 @@ class RTMapsAbstraction(RTMapsWrapper):
 
     def check_action_availability(self, component_id, action):
         if self._enable_checks:
-            available_actions = self.get_action_names_for_component(component_id)
             action_name = "{}.{}".format(component_id, action)
+            available_actions = self._get_cached_names(component_id, "actions", action_name)
             if action_name not in available_actions:
-                raise RTMapsException("{} is not a valid action. Valid actions are: {}".format(action_name, available_actions))
+                raise RTMapsException("{} is not a valid action. Valid actions are: {}".format(action_name, sorted(available_actions)))
 
     def check_outport_availability(self, component_id, outport):
         if self._enable_checks:
-            available_outports = self.get_output_names_for_component(component_id)
             outport_name = "{}.{}".format(component_id, outport)
+            available_outports = self._get_cached_names(component_id, "outputs", outport_name)
             if outport_name not in available_outports:
-                raise RTMapsException("{} is not a valid outport. Valid outports are: {}".format(outport_name, available_outports))
+                raise RTMapsException("{} is not a valid outport. Valid outports are: {}".format(outport_name, sorted(available_outports)))
 
     def check_inport_availability(self, component_id, inport):
         if self._enable_checks:
-            available_inports = self.get_input_names_for_component(component_id)
             inport_name = "{}.{}".format(component_id, inport)
+            available_inports = self._get_cached_names(component_id, "inputs", inport_name)
             if inport_name not in available_inports:
-                raise RTMapsException("{} is not a valid inport. Valid inports are: {}".format(inport_name, available_inports))
+                raise RTMapsException("{} is not a valid inport. Valid inports are: {}".format(inport_name, sorted(available_inports)))
     
     def check_property_availability(self, component_id, property_name):
         if self._enable_checks:    
-            available_properties = self.get_property_names_for_component(component_id)
             property_name = "{}.{}".format(component_id, property_name)
+            available_properties = self._get_cached_names(component_id, "properties", property_name)
             if property_name not in available_properties:
-                raise RTMapsException("{} is not a valid property. Valid properties are: {}".format(property_name, available_properties))
+                raise RTMapsException("{} is not a valid property. Valid properties are: {}".format(property_name, sorted(available_properties)))
 
     def check_input_property_availability(self, property_name):
         if self._enable_checks:    
@@ -608,17 +1238,64 @@ class RTMapsAbstraction(RTMapsWrapper):
         return enum_string.split("|")[2:]
 
     def check_enum_property_validity(self, component_id, property_name, value):
-        if self.is_enum_property(component_id, property_name):
-            valid_enum_values = self.get_valid_enum_properties(component_id, property_name)
+        valid_enum_values = self._get_cached_enum_domain(component_id, property_name)
+        if valid_enum_values is not None:
             if type(value) is str:
                 if value not in valid_enum_values:
-                    raise RTMapsException("{} is not a valid enum value for property {}. Valid vales are {}".format(value, property_name, valid_enum_values))
+                    raise RTMapsException("{} is not a valid enum value for property {}. Valid vales are {}".format(value, property_name, list(valid_enum_values)))
             elif type(value) is int:
                 if value < 0 or value >= len(valid_enum_values):
                     raise RTMapsException("{} is out of range for enum property {}. It must be [{},{})".format(value, property_name, 0, len(valid_enum_values)))
             else:
                 raise RTMapsException("Type {} is not allowed for enum properties".format(type(value)))
 
+    def invalidate_introspection(self, component_id=None):
+        """
+        Drops the cached inputs, outputs, properties, actions and enum domains of a component (of all components if
+        component_id is None). Call it after changing a property that makes a component create or remove ports.
+        """
+        if component_id is None:
+            self._introspection.clear()
+            self._seeded_introspection.clear()
+            self._enum_domains.clear()
+        else:
+            self._introspection.pop(component_id, None)
+            self._seeded_introspection.difference_update([key for key in self._seeded_introspection if key[0] == component_id])
+            for key in [key for key in self._enum_domains if key[0] == component_id]:
+                del self._enum_domains[key]
+
+    def _get_cached_names(self, component_id, kind, name=None):
+        """
+        Names of the given kind ("inputs", "outputs", "properties" or "actions"), queried once per component. Names
+        seeded from a .rtd may miss runtime ports and non-persistent properties: when name is not among them, the
+        engine is queried once before the names are returned.
+        """
+        cache = self._introspection.setdefault(component_id, {})
+        if name is not None and (component_id, kind) in self._seeded_introspection and name not in cache.get(kind, ()):
+            self._seeded_introspection.discard((component_id, kind))
+            cache.pop(kind, None)
+        try:
+            return cache[kind]
+        except KeyError:
+            getter = {
+                "inputs": self.get_input_names_for_component,
+                "outputs": self.get_output_names_for_component,
+                "properties": self.get_property_names_for_component,
+                "actions": self.get_action_names_for_component,
+            }[kind]
+            names = cache[kind] = frozenset(getter(component_id))
+            return names
+
+    def _get_cached_enum_domain(self, component_id, property_name):
+        """ Valid values of an enum property as a tuple, None if the property is not an enum. """
+        key = (component_id, property_name)
+        try:
+            return self._enum_domains[key]
+        except KeyError:
+            enum_string = super(RTMapsAbstraction, self).get_enum_property("{}.{}".format(component_id, property_name))
+            domain = self._enum_domains[key] = tuple(enum_string.split("|")[2:]) if "|" in enum_string else None
+            return domain
+
     def get_integer_property(self, component_id, property_name):
         self.check_component_availability(component_id)
         self.check_property_availability(component_id, property_name)
@@ -664,6 +1341,37 @@ class RTMapsAbstraction(RTMapsWrapper):
         self.check_outport_availability(component_id, output_name)
         return super(RTMapsAbstraction, self).read_float64_vector_timeout_meta(f"{component_id}.{output_name}", vector_size, timeout)
 
+    def read_float64_array_timeout_meta(self, component_id, output_name, timeout, out=None, vector_size=None):
+        self.check_component_availability(component_id)
+        self.check_outport_availability(component_id, output_name)
+        return super(RTMapsAbstraction, self).read_float64_array_timeout_meta(f"{component_id}.{output_name}", timeout, out, vector_size)
+
+    def read_user_structure_array_timeout_meta(self, component_id, output_name, custom_structure_type, vector_size, timeout, out=None):
+        self.check_component_availability(component_id)
+        self.check_outport_availability(component_id, output_name)
+        return super(RTMapsAbstraction, self).read_user_structure_array_timeout_meta(
+            f"{component_id}.{output_name}", custom_structure_type, vector_size, timeout, out)
+
+    def readinto(self, component_id, output_name, buffer, timeout):
+        self.check_component_availability(component_id)
+        self.check_outport_availability(component_id, output_name)
+        return super(RTMapsAbstraction, self).readinto(f"{component_id}.{output_name}", buffer, timeout)
+
+    def read_frame(self, component_id, output_name, pool, timeout):
+        self.check_component_availability(component_id)
+        self.check_outport_availability(component_id, output_name)
+        return super(RTMapsAbstraction, self).read_frame(f"{component_id}.{output_name}", pool, timeout)
+
+    def subscribe(self, component_id, output_name, kind="float64", maxsize=1024, policy=DROP_OLDEST, size=None, poll_timeout=100000):
+        self.check_component_availability(component_id)
+        self.check_outport_availability(component_id, output_name)
+        return super(RTMapsAbstraction, self).subscribe(f"{component_id}.{output_name}", kind, maxsize, policy, size, poll_timeout)
+
+    def watch(self, component_id, property_name, callback, period=0.1, kind="integer"):
+        self.check_component_availability(component_id)
+        self.check_property_availability(component_id, property_name)
+        return super(RTMapsAbstraction, self).watch("{}.{}".format(component_id, property_name), callback, period, kind)
+
     def send_int32(self, component_id, input_name, value):
         self.check_component_availability(component_id)
         self.check_inport_availability(component_id, input_name)
@@ -679,6 +1387,15 @@ class RTMapsAbstraction(RTMapsWrapper):
         #self.check_inport_availability(component_id, input_name)
         return super(RTMapsAbstraction, self).send_int64_ts("{}.{}".format(component_id, input_name), value, timestamp)
 
+    def send_float64_ts(self, component_id, input_name, value, timestamp):
+        self.check_component_availability(component_id)
+        return super(RTMapsAbstraction, self).send_float64_ts("{}.{}".format(component_id, input_name), value, timestamp)
+
+    def send_batch(self, component_id, input_name, values, timestamps):
+        self.check_component_availability(component_id)
+        self.check_inport_availability(component_id, input_name)
+        return super(RTMapsAbstraction, self).send_batch("{}.{}".format(component_id, input_name), values, timestamps)
+
     def load_diagram(self, diagram_path, reset=True):
         path = Path(diagram_path)
         if not path.is_file():
@@ -692,26 +1409,93 @@ class RTMapsAbstraction(RTMapsWrapper):
 
     def _load_rtm(self, diagram_path, reset=True):
         if reset: self.reset()
-        with open(diagram_path) as file:
-            command = "loaddiagram <<{}>>".format(diagram_path)
-            self.parse(command)
-            for line in file:
-                line_splitted = line.strip().split()
-                # Check if line contains a component being added
-                if not any(char in line for char in invalid_name_characters) and len(line_splitted) == 2:
-                    self._components.add(line_splitted[1])
+        self.invalidate_introspection()
+        index = DiagramIndex.load(diagram_path)
+        command = "loaddiagram <<{}>>".format(diagram_path)
+        self.parse(command)
+        self._components.update(index.components)
+        if reset:
+            self.diagram_index = index
+        else:
+            self.diagram_index.update(index)
 
     def _load_rtd(self, file_path):
         self.reset()
-        namespaces = {"int":"http://schemas.intempora.com/RTMaps/2011/RTMapsFiles"}
-        root = et.parse(file_path)
+        index = DiagramIndex.load(file_path)
         command = "loaddiagram <<{}>>".format(file_path)
         self.parse(command)
-        for component_nodes in root.findall('int:Component', namespaces=namespaces):
-            self._components.add(component_nodes.attrib["InstanceName"])
+        self._components.update(index.components)
+        self._seed_introspection(index, index.components)
+        self.diagram_index = index
+
+    def _seed_introspection(self, index, component_ids):
+        """
+        The .rtd lists the inputs, outputs and properties of the components, so the checks of those names need not
+        query the engine. The list may be incomplete, see _get_cached_names.
+        """
+        for component_id in component_ids:
+            cache = self._introspection.setdefault(component_id, {})
+            for kind, names in (("inputs", index.inputs.get(component_id)), ("outputs", index.outputs.get(component_id)),
+                                ("properties", index.properties.get(component_id))):
+                if names:
+                    cache[kind] = frozenset("{}.{}".format(component_id, name) for name in names)
+                    self._seeded_introspection.add((component_id, kind))
+
+    def apply_diagram(self, diagram_path):
+        """
+        Brings the running diagram to the state described by the .rtd/.rtm file diagram_path, issuing only the
+        commands needed: disconnections, kills of removed (or retyped) components, additions, changed property
+        values, then new connections. Components left untouched keep running, so their drivers are not
+        re-initialized. Loads the diagram from scratch when no diagram is loaded yet. Returns the issued commands.
+
+        Only components, connections and property values are compared: packages required by new components must
+        already be registered.
+        """
+        path = Path(diagram_path)
+        if not path.is_file():
+            raise RTMapsException("{} is not a file".format(diagram_path))
+        current = self.diagram_index
+        if not current.components:
+            self.load_diagram(diagram_path)
+            return ["loaddiagram <<{}>>".format(diagram_path)]
+        target = DiagramIndex.load(diagram_path)
+
+        killed = [c for c, model in current.components.items() if target.components.get(c) != model]
+        added = [c for c, model in target.components.items() if current.components.get(c) != model]
+        prefixes = tuple(c + "." for c in killed)
+        commands = ["{} -X- {}".format(*c) for c in current.connections
+                    if c not in target.connections and not c[0].startswith(prefixes) and not c[1].startswith(prefixes)]
+        commands += ["kill {}".format(c) for c in killed]
+        commands += ["{} {}".format(target.components[c], c) for c in added]
+        for component_id, properties in target.properties.items():
+            current_properties = {} if component_id in added else current.properties.get(component_id, {})
+            commands += ["{}.{} = {}".format(component_id, name, DiagramIndex.format_text_value(value))
+                         for name, value in properties.items() if current_properties.get(name) != value]
+        commands += ["{} -> {}".format(*c) for c in target.connections
+                     if c not in current.connections or c[0].startswith(prefixes) or c[1].startswith(prefixes)]
+
+        kills = {"kill {}".format(c): c for c in killed}
+        additions = {"{} {}".format(target.components[c], c): c for c in added}
+        for command in commands:  # the components follow each command, so a failure leaves them as the engine
+            self.parse(command)
+            if command in kills:
+                self._components.discard(kills[command])
+                self.invalidate_introspection(kills[command])
+            elif command in additions:
+                self._components.add(additions[command])
+                self.invalidate_introspection(additions[command])
+                self._seed_introspection(target, [additions[command]])
+        self.diagram_index.path = target.path
+        return commands
     
+    def parse(self, command, add_to_command_log=True):
+        super(RTMapsAbstraction, self).parse(command, add_to_command_log)
+        self.diagram_index.apply_command(command)
+
     def reset(self):
+        self.diagram_index = DiagramIndex(None)
         self._components.clear()
+        self.invalidate_introspection()
         super(RTMapsAbstraction, self).reset()
 
     def register_std_report_reader(self):
@@ -726,7 +1510,367 @@ class RTMapsAbstraction(RTMapsWrapper):
         else:
             return "<<{}>>".format(str(v))
 
-            
+
+class DiagramIndex(object):
+    """
+    Components, types, connections and property values of a .rtd or .rtm file, read without the engine.
+
+    .rtd files are read incrementally with iterparse; they also provide the inputs, outputs and properties of
+    every component. .rtm scripts are replayed line by line (additions, kill, ->, -X- and property assignments).
+    DiagramIndex.load() keeps the index in a JSON file under cache_dir, keyed by the path, modification time and
+    size of the diagram, so reopening an unchanged diagram does not read it again. Set cache_dir to None to
+    disable the cache. RTMapsAbstraction keeps the index of the current diagram up to date with apply_command().
+    """
+    FORMAT_VERSION = 1
+    cache_dir = os.path.join(str(Path.home()), ".cache", "rtmaps", "diagram_index")
+
+    def __init__(self, path, components=None, connections=None, properties=None, inputs=None, outputs=None):
+        self.path = str(path) if path is not None else None
+        self.components = components if components is not None else dict()  # id -> type, in diagram order
+        self.connections = connections if connections is not None else list()  # ("A.output", "B.input")
+        self.properties = properties if properties is not None else dict()  # id -> {property: value as text}
+        self.inputs = inputs if inputs is not None else dict()  # id -> [input names], .rtd only
+        self.outputs = outputs if outputs is not None else dict()  # id -> [output names], .rtd only
+
+    def __repr__(self):
+        return "DiagramIndex({!r}, {} components, {} connections)".format(self.path, len(self.components), len(self.connections))
+
+    @classmethod
+    def load(cls, path, use_cache=True):
+        """ Returns the index of the diagram at path, from the disk cache when the file did not change. """
+        path = os.path.abspath(str(path))
+        stat = os.stat(path)
+        cache_file = cls._cache_file(path) if use_cache and cls.cache_dir else None
+        if cache_file:
+            try:
+                with open(cache_file) as file:
+                    data = json.load(file)
+                if (data["version"], data["path"], data["mtime_ns"], data["size"]) == \
+                        (cls.FORMAT_VERSION, path, stat.st_mtime_ns, stat.st_size):
+                    return cls(path, data["components"], [tuple(c) for c in data["connections"]],
+                               data["properties"], data["inputs"], data["outputs"])
+            except (OSError, ValueError, KeyError):
+                pass
+        index = cls.parse(path)
+        if cache_file:
+            index._save(cache_file, stat)
+        return index
+
+    @classmethod
+    def parse(cls, path):
+        suffix = Path(path).suffix.lower()
+        if suffix == ".rtd":
+            return cls._parse_rtd(path)
+        elif suffix == ".rtm":
+            return cls._parse_rtm(path)
+        raise RTMapsException("{} is not a valid diagram file".format(path))
+
+    @classmethod
+    def _parse_rtd(cls, path):
+        index = cls(path)
+        depth = 0
+        component = None
+        for event, element in et.iterparse(path, events=("start", "end")):
+            tag = element.tag.rsplit("}", 1)[-1]
+            if event == "start":
+                depth += 1
+                if depth == 2 and tag == "Component":
+                    component = element.attrib.get("InstanceName")
+                    if component is not None:
+                        index.components[component] = element.attrib.get("Model", "")
+                        index.properties[component] = dict()
+                        index.inputs[component] = list()
+                        index.outputs[component] = list()
+                elif depth == 3 and component is not None and tag in ("Input", "Output"):
+                    name = element.attrib.get("LocalName")
+                    if name is not None:
+                        (index.inputs if tag == "Input" else index.outputs)[component].append(name)
+                continue
+            depth -= 1
+            if depth == 2 and component is not None and tag == "Property":
+                name = element.attrib.get("LocalName")
+                if name is not None:
+                    index.properties[component][name] = (element.text or "").strip()
+            elif depth == 1:
+                if tag == "Connection" and "Output" in element.attrib and "Input" in element.attrib:
+                    index.connections.append((element.attrib["Output"], element.attrib["Input"]))
+                component = None
+                element.clear()  # keeps memory bounded on large diagrams
+        return index
+
+    @classmethod
+    def _parse_rtm(cls, path):
+        index = cls(path)
+        with open(path) as file:
+            for line in file:
+                index.apply_command(line.strip())
+        return index
+
+    def apply_command(self, command):
+        """ Updates the index with one RTMaps script command; commands that do not change the model are ignored. """
+        tokens = command.split()
+        if not tokens or command.startswith(("#", "//")):
+            return
+        target, assignment, value = command.partition("=")
+        target = target.strip()
+        if assignment and target and not any(char.isspace() for char in target):
+            parts = target.split(".")
+            if len(parts) == 2 and parts[0] in self.components:
+                value = value.strip()
+                if value.startswith("<<") and value.endswith(">>"):
+                    value = value[2:-2]
+                self.properties[parts[0]][parts[1]] = value
+        elif " -> " in command or " -X- " in command:
+            connected = " -> " in command
+            producer, consumer = [part.strip() for part in command.split(" -> " if connected else " -X- ", 1)]
+            if connected:
+                self.connections.append((producer, consumer))
+            elif (producer, consumer) in self.connections:
+                self.connections.remove((producer, consumer))
+        elif tokens[0] == "kill" and len(tokens) == 2:
+            self._remove_component(tokens[1])
+        elif len(tokens) == 2 and not any(char in command for char in invalid_name_characters):
+            self.components[tokens[1]] = tokens[0]
+            self.properties[tokens[1]] = dict()
+
+    def _remove_component(self, component_id):
+        self.components.pop(component_id, None)
+        self.properties.pop(component_id, None)
+        self.inputs.pop(component_id, None)
+        self.outputs.pop(component_id, None)
+        prefix = component_id + "."
+        self.connections = [c for c in self.connections if not c[0].startswith(prefix) and not c[1].startswith(prefix)]
+
+    def update(self, other):
+        """ Adds the components, connections and property values of another index to this one. """
+        for component_id, model in other.components.items():
+            self.components[component_id] = model
+            self.properties.setdefault(component_id, dict()).update(other.properties.get(component_id, {}))
+        self.connections += [c for c in other.connections if c not in self.connections]
+        self.inputs.update(other.inputs)
+        self.outputs.update(other.outputs)
+
+    @staticmethod
+    def format_text_value(value):
+        """ Formats a property value read from a diagram file for an RTMaps script assignment. """
+        if value in ("true", "false"):
+            return value
+        try:
+            float(value)
+            return value
+        except ValueError:
+            return "<<{}>>".format(value)
+
+    def component_type(self, component_id):
+        return self.components.get(component_id)
+
+    def components_of_type(self, component_type):
+        return [component_id for component_id, model in self.components.items() if model == component_type]
+
+    def connections_from(self, component_id):
+        prefix = component_id + "."
+        return [c for c in self.connections if c[0].startswith(prefix)]
+
+    def connections_to(self, component_id):
+        prefix = component_id + "."
+        return [c for c in self.connections if c[1].startswith(prefix)]
+
+    def property_value(self, component_id, property_name):
+        return self.properties.get(component_id, {}).get(property_name)
+
+    @classmethod
+    def _cache_file(cls, path):
+        return os.path.join(cls.cache_dir, hashlib.sha1(path.encode('utf-8')).hexdigest() + ".json")
+
+    def _save(self, cache_file, stat):
+        data = {"version": self.FORMAT_VERSION, "path": self.path, "mtime_ns": stat.st_mtime_ns, "size": stat.st_size,
+                "components": self.components, "connections": self.connections, "properties": self.properties,
+                "inputs": self.inputs, "outputs": self.outputs}
+        try:
+            os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+            temporary_file = "{}.{}.tmp".format(cache_file, os.getpid())
+            with open(temporary_file, "w") as file:
+                json.dump(data, file)
+            os.replace(temporary_file, cache_file)
+        except OSError as ex:
+            logging.warning("Could not write diagram index cache {}: {}".format(cache_file, ex))
+
+
+class DiagramBatch(object):
+    """
+    Collects diagram construction commands and submits them together when the with block exits:
+
+        with maps.batch() as batch:
+            batch.add_component("Generator", "Generator_1")
+            batch.set_property("Generator_1", "frequency", 100)
+            batch.connect_components("Generator_1", "output", "DataViewer_1", "input")
+
+    The component ids are validated first, replaying the additions and removals of the batch in order. The
+    additions of new component ids are then submitted, and every other command whose components are valid is
+    validated against the introspection data of its components, fetched once per component. All the validation
+    errors are reported in a single RTMapsException (the components added by the batch are then removed again).
+    Only when everything is valid are the remaining commands submitted, in the order they were queued. A component
+    removed and added again by the batch only exists once its removal is submitted: the commands using it after
+    its addition are checked as they are submitted. If a command fails during the submission, the components
+    added and the connections made by the batch are undone before the exception is raised again; removals,
+    disconnections, property values and actions already submitted are not.
+    """
+    def __init__(self, maps):
+        self._maps = maps
+        self._operations = list()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.submit()
+
+    def __len__(self):
+        return len(self._operations)
+
+    def add_component(self, component_type, component_id, xpos=None, ypos=None, zpos=0):
+        self._operations.append(("add_component", (component_type, component_id, xpos, ypos, zpos)))
+
+    def remove_component(self, component_id):
+        self._operations.append(("remove_component", (component_id,)))
+
+    def connect_components(self, producer_id, producer_outport, consumer_id, consumer_inport):
+        self._operations.append(("connect_components", (producer_id, producer_outport, consumer_id, consumer_inport)))
+
+    def disconnect_components(self, producer_id, producer_outport, consumer_id, consumer_inport):
+        self._operations.append(("disconnect_components", (producer_id, producer_outport, consumer_id, consumer_inport)))
+
+    def execute_action(self, component_id, action):
+        self._operations.append(("execute_action", (component_id, action)))
+
+    def record_signal(self, producer_id, producer_outport, recorder_id, recording_method):
+        self._operations.append(("record_signal", (producer_id, producer_outport, recorder_id, recording_method)))
+
+    def set_property(self, component_id, property_name, value):
+        self._operations.append(("set_property", (component_id, property_name, value)))
+
+    def set_input_property(self, component_id, input_name, property_name, value):
+        self._operations.append(("set_input_property", (component_id, input_name, property_name, value)))
+
+    def set_output_property(self, component_id, output_name, property_name, value):
+        self._operations.append(("set_output_property", (component_id, output_name, property_name, value)))
+
+    def submit(self):
+        maps = self._maps
+        operations, self._operations = self._operations, list()
+        errors, plan = self._check_components(operations)
+
+        enable_checks = maps._enable_checks
+        maps._enable_checks = False
+        added = list()
+        try:
+            for (name, args), step in zip(operations, plan):
+                if step == "add":
+                    maps.add_component(*args)
+                    added.append(args[1])
+            maps._enable_checks = enable_checks
+            errors += self._check_operations([operation for operation, step in zip(operations, plan) if step == "check"])
+            if errors:
+                maps._enable_checks = False
+                for component_id in added:
+                    maps.remove_component(component_id)
+                raise RTMapsException("Invalid diagram batch:\n" + "\n".join(errors))
+            applied = [("add_component", args) for (name, args), step in zip(operations, plan) if step == "add"]
+            try:
+                for (name, args), step in zip(operations, plan):
+                    if step != "add":
+                        maps._enable_checks = enable_checks and step == "deferred"
+                        getattr(maps, name)(*args)
+                        applied.append((name, args))
+            except Exception:
+                maps._enable_checks = False
+                self._roll_back(applied)
+                raise
+        finally:
+            maps._enable_checks = enable_checks
+
+    def _roll_back(self, applied):
+        """ Undoes, as far as possible, the additions and connections of the operations applied (in order). """
+        maps = self._maps
+        for name, args in reversed(applied):
+            try:
+                if name == "connect_components":
+                    maps.disconnect_components(*args)
+                elif name == "add_component" and args[1] in maps._components:
+                    maps.remove_component(args[1])
+            except RTMapsException:  # e.g. already undone by a later operation of the batch
+                pass
+
+    def _check_components(self, operations):
+        """
+        Checks the component ids used by the operations, replaying the additions and removals of the batch, and
+        returns the errors with the plan of every operation: "add" (new component id, added before the checks),
+        "check" (checked before the submission), "deferred" (checked when submitted) or "invalid".
+        """
+        errors = list()
+        plan = list()
+        components = set(self._maps._components)
+        known = set(components)  # ids that existed at some point of the batch
+        added_again = set()  # ids removed then added again by the batch
+        for name, args in operations:
+            if name == "add_component":
+                component_id = args[1]
+                if component_id in components:
+                    errors.append("A component with name {} does already exist".format(component_id))
+                    plan.append("invalid")
+                    continue
+                if component_id in known:
+                    added_again.add(component_id)
+                    plan.append("deferred")
+                else:
+                    plan.append("add")
+                components.add(component_id)
+                known.add(component_id)
+                continue
+            used = (args[0], args[2]) if name in ("connect_components", "disconnect_components") else (args[0],)
+            invalid = [component_id for component_id in used if component_id not in components]
+            for component_id in invalid:
+                errors.append("{} is not a valid component id".format(component_id))
+            if invalid:
+                plan.append("invalid")
+            elif name == "remove_component":
+                plan.append("run")
+            else:
+                plan.append("deferred" if any(component_id in added_again for component_id in used) else "check")
+            if name == "remove_component":
+                components.discard(args[0])
+                added_again.discard(args[0])
+        if not self._maps._enable_checks:
+            return [], [step if step == "add" else "run" for step in plan]
+        return errors, plan
+
+    def _check_operations(self, operations):
+        """ Runs the RTMapsAbstraction checks of every operation and returns all the error messages. """
+        maps = self._maps
+        checks = {
+            "connect_components": lambda p, o, c, i: (maps.check_outport_availability(p, o), maps.check_inport_availability(c, i)),
+            "disconnect_components": lambda p, o, c, i: (maps.check_outport_availability(p, o), maps.check_inport_availability(c, i)),
+            "execute_action": maps.check_action_availability,
+            "record_signal": lambda p, o, r, m: maps.check_outport_availability(p, o),
+            "set_property": lambda c, p, v: (maps.check_property_availability(c, p), maps.check_enum_property_validity(c, p, v)),
+            "set_input_property": lambda c, i, p, v: (maps.check_inport_availability(c, i), maps.check_input_property_availability(p)),
+            "set_output_property": lambda c, o, p, v: (maps.check_outport_availability(c, o), maps.check_output_property_availability(p)),
+        }
+        errors = list()
+        if not maps._enable_checks:
+            return errors
+        for name, args in operations:
+            check = checks.get(name)
+            if check is None:
+                continue
+            try:
+                check(*args)
+            except RTMapsException as ex:
+                errors.append(str(ex))
+        return errors
+
+
 def stdReportReader(dummy, level, message):
     message=message.decode('utf-8')
     print("[RTMaps] {}".format(message))
@@ -0,0 +1,185 @@
+# coding=utf-8
+#
+#  Copyright (C) INTEMPORA S.A.S
+#  ALL RIGHTS RESERVED.
+
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from rtmaps import RTMapsWrapper, RTMapsPort, RTMapsException
+
+
+class _ReportStream(object):
+    """ Async iterator over (level, message) tuples reported by the engine, see AsyncRTMaps.reports(). """
+    def __init__(self, owner, loop, maxsize):
+        self._owner = owner
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize)
+        self.dropped = 0
+        self.closed = False
+
+    def _put(self, level, message):  # called in the event loop thread
+        try:
+            self._queue.put_nowait((level, message.decode('utf-8', errors='replace')))
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.closed and self._queue.empty():
+            raise StopAsyncIteration
+        item = await self._queue.get()
+        if item is None:
+            raise StopAsyncIteration
+        return item
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self._owner._streams.discard(self)
+            try:
+                self._queue.put_nowait(None)
+            except asyncio.QueueFull:
+                pass
+
+
+class AsyncRTMaps(object):
+    """
+    asyncio front-end for an RTMapsWrapper (or RTMapsAbstraction) instance.
+
+    Every call is run on a dedicated thread pool so that blocking reads and lifecycle commands never stall the
+    event loop; ports and properties are addressed by their full "Component.name", as with RTMapsWrapper.
+
+        async with AsyncRTMaps(RTMapsAbstraction()) as maps:
+            await maps.load_diagram("diagram.rtd")
+            await maps.run()
+            value = await maps.read_float64_timeout("Generator_1.output", 100000)
+    """
+    def __init__(self, maps, max_workers=32):
+        self.maps = maps
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="AsyncRTMaps")
+        self._local = threading.local()
+        self._streams = set()
+        self._report_reader_registered = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        for stream in list(self._streams):
+            stream.close()
+        self._executor.shutdown(wait=False)
+
+    async def call(self, func, *args, **kwargs):
+        """ Runs func(*args, **kwargs) on the executor and returns its result. """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    # Lifecycle
+
+    async def parse(self, command):
+        return await self.call(self.maps.parse, command)
+
+    async def load_diagram(self, diagram_path, reset=True):
+        if not hasattr(self.maps, "load_diagram"):
+            raise RTMapsException("load_diagram requires an RTMapsAbstraction")
+        return await self.call(self.maps.load_diagram, diagram_path, reset)
+
+    async def run(self):
+        return await self.call(self.maps.run)
+
+    async def shutdown(self):
+        return await self.call(self.maps.shutdown)
+
+    async def reset(self):
+        return await self.call(self.maps.reset)
+
+    async def play(self):
+        return await self.call(self.maps.play)
+
+    async def stop(self):
+        return await self.call(self.maps.stop)
+
+    async def pause(self):
+        return await self.call(self.maps.pause)
+
+    async def is_running(self):
+        return await self.call(self.maps.is_running)
+
+    async def get_current_time(self):
+        return await self.call(self.maps.get_current_time)
+
+    # Reads: each executor thread has its own port handles, so concurrent reads never share out-parameters
+
+    async def read_int32_timeout(self, name, timeout):
+        return await self.call(self._read, name, "read_int32_timeout", timeout)
+
+    async def read_int64_timeout(self, name, timeout):
+        return await self.call(self._read, name, "read_int64_timeout", timeout)
+
+    async def read_float64_timeout(self, name, timeout):
+        return await self.call(self._read, name, "read_float64_timeout", timeout)
+
+    async def read_sample(self, name, kind, timeout, size=None):
+        return await self.call(self._read, name, "read_sample", kind, timeout, size)
+
+    def _read(self, name, method, *args):
+        ports = getattr(self._local, "ports", None)
+        if ports is None:
+            ports = self._local.ports = dict()
+        port = ports.get(name)
+        if port is None:
+            port = ports[name] = RTMapsPort(self.maps._api, name)
+        return getattr(port, method)(*args)
+
+    # Sends and properties
+
+    async def send_int32(self, name, value):
+        return await self.call(RTMapsWrapper.send_int32, self.maps, name, value)
+
+    async def send_int32_ts(self, name, value, timestamp):
+        return await self.call(RTMapsWrapper.send_int32_ts, self.maps, name, value, timestamp)
+
+    async def send_int64_ts(self, name, value, timestamp):
+        return await self.call(RTMapsWrapper.send_int64_ts, self.maps, name, value, timestamp)
+
+    async def get_integer_property(self, name):
+        return await self.call(RTMapsWrapper.get_integer_property, self.maps, name)
+
+    async def get_float_property(self, name):
+        return await self.call(RTMapsWrapper.get_float_property, self.maps, name)
+
+    async def get_string_property(self, name):
+        return await self.call(RTMapsWrapper.get_string_property, self.maps, name)
+
+    async def get_enum_property(self, name):
+        return await self.call(RTMapsWrapper.get_enum_property, self.maps, name)
+
+    # Reports
+
+    def reports(self, maxsize=10000):
+        """
+        Returns an async iterator over the (level, message) reports of the engine, from now on. Reports arriving
+        while maxsize of them are pending are dropped and counted in the iterator's dropped attribute. This
+        replaces any report reader previously registered on the wrapper.
+        """
+        stream = _ReportStream(self, asyncio.get_running_loop(), maxsize)
+        self._streams.add(stream)
+        if not self._report_reader_registered:
+            self.maps.register_report_reader(self._on_report)
+            self._report_reader_registered = True
+        return stream
+
+    def _on_report(self, dummy, level, message):  # called on the engine's reporting thread
+        for stream in list(self._streams):
+            try:
+                stream._loop.call_soon_threadsafe(stream._put, level, message)
+            except RuntimeError:  # event loop closed
+                self._streams.discard(stream)
@@ -0,0 +1,146 @@
+# coding=utf-8
+#
+#  Copyright (C) INTEMPORA S.A.S
+#  ALL RIGHTS RESERVED.
+
+import threading
+
+import numpy as np
+
+from rtmaps import RTMapsException
+
+
+class LatencyHistogram(object):
+    """
+    Fixed-width histogram of durations in microseconds. Memory does not grow with the number of samples: values
+    above max_us are counted in an overflow bin, and percentiles are resolved to the upper edge of a bin.
+    """
+    def __init__(self, bin_width_us=100, max_us=1000000):
+        self.bin_width_us = int(bin_width_us)
+        self.counts = np.zeros(int(max_us) // self.bin_width_us + 2, dtype=np.int64)  # last bin is the overflow
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def add(self, value_us):
+        index = int(value_us) // self.bin_width_us
+        if index < 0:
+            index = 0
+        elif index >= len(self.counts):
+            index = len(self.counts) - 1
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value_us
+        self.min = value_us if self.min is None else min(self.min, value_us)
+        self.max = value_us if self.max is None else max(self.max, value_us)
+
+    def percentile(self, q):
+        if not self.count:
+            return None
+        rank = int(np.ceil(self.count * q / 100.0))
+        index = int(np.searchsorted(np.cumsum(self.counts), max(rank, 1)))
+        if index == len(self.counts) - 1:  # overflow bin
+            return self.max
+        return min((index + 1) * self.bin_width_us, self.max)
+
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def summary(self, percentiles=(50, 90, 99)):
+        result = {"count": self.count, "min": self.min, "max": self.max, "mean": self.mean()}
+        for q in percentiles:
+            result["p{:g}".format(q)] = self.percentile(q)
+        return result
+
+
+class _PortStatistics(object):
+    __slots__ = ("latency", "jitter", "last_timestamp", "last_interval")
+
+    def __init__(self, bin_width_us, max_us):
+        self.latency = LatencyHistogram(bin_width_us, max_us)
+        self.jitter = LatencyHistogram(bin_width_us, max_us)
+        self.last_timestamp = None
+        self.last_interval = None
+
+
+class LatencyMonitor(object):
+    """
+    Per-port latency and jitter statistics computed from RTMapsSample records.
+
+    The latency of a sample is the engine time at which Python got it (get_current_time()) minus its time of issue,
+    or minus its timestamp for readers without metadata. The jitter is the absolute difference between two
+    consecutive inter-sample intervals. Both are in microseconds, like every RTMaps time.
+
+        monitor = LatencyMonitor(maps, budget_us=5000)
+        sample = monitor.read("Lidar_1.points", "float64_vector", 100000, 10000)
+        ...
+        print(monitor.report())
+    """
+    def __init__(self, maps, budget_us=None, bin_width_us=100, max_us=1000000):
+        self._maps = maps
+        self.budget_us = budget_us
+        self._bin_width_us = bin_width_us
+        self._max_us = max_us
+        self._ports = dict()
+        self._lock = threading.Lock()
+
+    def read(self, name, kind, timeout, size=None):
+        """ Reads a sample with RTMapsWrapper.read_sample and records it. Returns the sample or None. """
+        sample = self._maps.read_sample(name, kind, timeout, size)
+        if sample is not None:
+            self.record(name, sample)
+        return sample
+
+    def record(self, name, sample, read_time=None):
+        """ Records a sample read from the port name. read_time defaults to the current engine time. """
+        if read_time is None:
+            read_time = self._maps.get_current_time()
+        issued = sample.time_of_issue if sample.time_of_issue is not None else sample.timestamp
+        with self._lock:
+            statistics = self._ports.get(name)
+            if statistics is None:
+                statistics = self._ports[name] = _PortStatistics(self._bin_width_us, self._max_us)
+            statistics.latency.add(read_time - issued)
+            if statistics.last_timestamp is not None:
+                interval = sample.timestamp - statistics.last_timestamp
+                if statistics.last_interval is not None:
+                    statistics.jitter.add(abs(interval - statistics.last_interval))
+                statistics.last_interval = interval
+            statistics.last_timestamp = sample.timestamp
+
+    def ports(self):
+        with self._lock:
+            return list(self._ports)
+
+    def latency(self, name):
+        return self._get(name).latency
+
+    def jitter(self, name):
+        return self._get(name).jitter
+
+    def report(self, percentiles=(50, 90, 99)):
+        """ Returns {port: {"latency": summary, "jitter": summary}} with the requested percentiles. """
+        with self._lock:
+            return {name: {"latency": statistics.latency.summary(percentiles),
+                           "jitter": statistics.jitter.summary(percentiles)}
+                    for name, statistics in self._ports.items()}
+
+    def over_budget(self, percentile=99):
+        """ Ports whose latency at the given percentile exceeds budget_us, worst first. """
+        if self.budget_us is None:
+            raise RTMapsException("No latency budget set")
+        with self._lock:
+            offenders = [(statistics.latency.percentile(percentile), name) for name, statistics in self._ports.items()]
+        return [name for value, name in sorted(offenders, reverse=True) if value is not None and value > self.budget_us]
+
+    def reset(self):
+        with self._lock:
+            self._ports.clear()
+
+    def _get(self, name):
+        with self._lock:
+            try:
+                return self._ports[name]
+            except KeyError:
+                raise RTMapsException("No sample recorded for {}".format(name))
@@ -0,0 +1,326 @@
+# coding=utf-8
+#
+#  Copyright (C) INTEMPORA S.A.S
+#  ALL RIGHTS RESERVED.
+
+import builtins
+import multiprocessing
+import threading
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from rtmaps import RTMapsAbstraction, RTMapsException
+
+SHARED_MEMORY_THRESHOLD = 65536  # bytes from which arrays and byte strings go through shared memory
+_SHUTDOWN_TIMEOUT = 10  # seconds given to a worker to exit its engine before it is terminated
+
+
+class _SharedPayload(object):
+    """ Placeholder sent over the pipe for an array or a byte string stored in a _SharedBuffer. """
+    __slots__ = ("buffer_name", "offset", "dtype", "shape", "is_bytes")
+
+    def __init__(self, buffer_name, offset, dtype, shape, is_bytes):
+        self.buffer_name = buffer_name
+        self.offset = offset
+        self.dtype = dtype
+        self.shape = shape
+        self.is_bytes = is_bytes
+
+    def __getstate__(self):
+        return self.buffer_name, self.offset, self.dtype, self.shape, self.is_bytes
+
+    def __setstate__(self, state):
+        self.buffer_name, self.offset, self.dtype, self.shape, self.is_bytes = state
+
+
+def _attach_shared_memory(name):
+    """ Attaches a segment created by the other process, which alone is responsible for unlinking it. """
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:
+        # Python < 3.13 registers the segment again, but the workers share the resource tracker of the client, in
+        # which the registration of the creator stays until its unlink(): unregistering here would remove it
+        return shared_memory.SharedMemory(name)
+
+
+class _SharedBuffer(object):
+    """
+    One direction of the shared memory of a worker. The writer owns a segment, grown (by replacing it) when a
+    message needs more room; the reader attaches to the segment named in each payload. Requests and replies are
+    strictly alternating, so one segment per direction is never written while it is being read.
+    """
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self._own = None
+        self._attached = None
+
+    def pack(self, value):
+        """ Returns value with its large arrays and byte strings (also in tuples, lists and dicts) moved into shared memory. """
+        large = list()
+        self._collect(value, large)
+        if not large:
+            return value
+        size = sum(-(-item.nbytes // 64) * 64 for item in large)
+        if self._own is None or self._own.size < size:
+            self.close()
+            self._own = shared_memory.SharedMemory(create=True, size=max(size, 2 * (self._own.size if self._own else 0)))
+        self._offset = 0
+        return self._pack(value)
+
+    def _collect(self, value, large):
+        if isinstance(value, np.ndarray):
+            if value.nbytes >= self.threshold and not value.dtype.hasobject:
+                large.append(value)
+        elif isinstance(value, (bytes, bytearray)):
+            if len(value) >= self.threshold:
+                large.append(memoryview(value))
+        elif isinstance(value, (tuple, list)):
+            for item in value:
+                self._collect(item, large)
+        elif isinstance(value, dict):
+            for item in value.values():
+                self._collect(item, large)
+
+    def _pack(self, value):
+        if isinstance(value, np.ndarray) and value.nbytes >= self.threshold and not value.dtype.hasobject:
+            return self._store(value, value.dtype.str, value.shape, False)
+        if isinstance(value, (bytes, bytearray)) and len(value) >= self.threshold:
+            return self._store(np.frombuffer(value, dtype=np.uint8), "|u1", (len(value),), True)
+        if isinstance(value, tuple):
+            return tuple(self._pack(item) for item in value)
+        if isinstance(value, list):
+            return [self._pack(item) for item in value]
+        if isinstance(value, dict):
+            return {key: self._pack(item) for key, item in value.items()}
+        return value
+
+    def _store(self, array, dtype, shape, is_bytes):
+        target = np.ndarray(shape, dtype=dtype, buffer=self._own.buf, offset=self._offset)
+        target[...] = array
+        payload = _SharedPayload(self._own.name, self._offset, dtype, shape, is_bytes)
+        self._offset += -(-array.nbytes // 64) * 64
+        return payload
+
+    def unpack(self, value):
+        """ Copies the payloads of a message packed by the other process out of its shared memory. """
+        if isinstance(value, _SharedPayload):
+            if self._attached is None or self._attached.name != value.buffer_name.lstrip("/"):
+                if self._attached is not None:
+                    self._attached.close()
+                self._attached = _attach_shared_memory(value.buffer_name)
+            array = np.ndarray(value.shape, dtype=value.dtype, buffer=self._attached.buf, offset=value.offset)
+            return array.tobytes() if value.is_bytes else array.copy()
+        if isinstance(value, tuple):
+            return tuple(self.unpack(item) for item in value)
+        if isinstance(value, list):
+            return [self.unpack(item) for item in value]
+        if isinstance(value, dict):
+            return {key: self.unpack(item) for key, item in value.items()}
+        return value
+
+    def close(self):
+        if self._own is not None:
+            self._own.close()
+            self._own.unlink()
+            self._own = None
+
+    def detach(self):
+        if self._attached is not None:
+            self._attached.close()
+            self._attached = None
+
+
+def _worker_main(connection, threshold):
+    """ Entry point of a worker process: hosts an RTMapsAbstraction and executes the calls received on connection. """
+    requests = _SharedBuffer(threshold)  # attached to the segment of the client
+    replies = _SharedBuffer(threshold)
+    try:
+        maps = RTMapsAbstraction()
+        connection.send(("ok", None))
+    except BaseException as ex:
+        connection.send(("error", ("RTMapsException", "Engine initialization failed: {}".format(ex))))
+        return
+    try:
+        while True:
+            try:
+                request = connection.recv()
+            except EOFError:  # the client process is gone
+                break
+            if request is None:
+                break
+            method, arguments = request
+            try:
+                args, kwargs = requests.unpack(arguments)
+                result = getattr(maps, method)(*args, **kwargs)
+                reply = ("ok", replies.pack(result))
+            except Exception as ex:
+                reply = ("error", (type(ex).__name__, str(ex)))
+            try:
+                connection.send(reply)
+            except Exception as ex:  # result that cannot be pickled
+                connection.send(("error", ("RTMapsException", "Result of {}() cannot be sent back: {}".format(method, ex))))
+    finally:
+        requests.detach()
+        replies.close()
+
+
+def _rebuild_exception(type_name, message):
+    """ Exceptions are sent back by name, RTMapsException (defined in builtins for its message) being unpicklable. """
+    if type_name == "RTMapsException":
+        return RTMapsException(message)
+    exception_type = getattr(builtins, type_name, None)
+    if isinstance(exception_type, type) and issubclass(exception_type, Exception):
+        return exception_type(message)
+    return RTMapsException("{}: {}".format(type_name, message))
+
+
+class EngineProxy(object):
+    """
+    Proxy of the RTMapsAbstraction hosted by a worker process of an EnginePool. It has the same methods; each call
+    is sent to the worker over a pipe and blocks until the result comes back. Arguments and results must be
+    picklable, so methods taking callbacks (register_report_reader, watch) or returning live objects (port,
+    subscribe, batch) are not available. Calls from several threads are serialized.
+    """
+    def __init__(self, index, context, threshold):
+        self.index = index
+        self._lock = threading.Lock()
+        self._requests = _SharedBuffer(threshold)
+        self._replies = _SharedBuffer(threshold)  # attached to the segment of the worker
+        self._connection, worker_connection = context.Pipe()
+        self._process = context.Process(target=_worker_main, args=(worker_connection, threshold),
+                                        name="RTMapsEngine-{}".format(index), daemon=True)
+        self._process.start()
+        worker_connection.close()
+
+    def _wait_ready(self):
+        self._receive("initialization")
+
+    def call(self, method, *args, **kwargs):
+        """ Calls method(*args, **kwargs) on the engine of the worker and returns its result. """
+        with self._lock:
+            self._send(method, args, kwargs)
+            return self._receive(method)
+
+    def _send(self, method, args, kwargs):
+        if not self._process.is_alive():
+            raise RTMapsException("Engine process {} is not running".format(self.index))
+        self._connection.send((method, self._requests.pack((args, kwargs))))
+
+    def _receive(self, method):
+        try:
+            status, value = self._connection.recv()
+        except EOFError:
+            raise RTMapsException("Engine process {} exited during {}() (exit code {})".format(
+                self.index, method, self._process.exitcode))
+        if status == "error":
+            raise _rebuild_exception(*value)
+        return self._replies.unpack(value)
+
+    def __getattr__(self, name):
+        if name.startswith("_") or not callable(getattr(RTMapsAbstraction, name, None)):
+            raise AttributeError("'{}' object has no attribute '{}'".format(type(self).__name__, name))
+        method = lambda *args, **kwargs: self.call(name, *args, **kwargs)
+        method.__name__ = name
+        method.__doc__ = getattr(RTMapsAbstraction, name).__doc__
+        return method
+
+    def close(self):
+        with self._lock:
+            if self._process.is_alive():
+                try:
+                    self._connection.send(None)
+                except OSError:
+                    pass
+                self._process.join(_SHUTDOWN_TIMEOUT)
+                if self._process.is_alive():
+                    self._process.terminate()
+                    self._process.join()
+            self._connection.close()
+            self._requests.close()
+            self._replies.detach()
+
+
+class EnginePool(object):
+    """
+    Runs size RTMaps engines side by side, one per worker process, since RTMapsWrapper is a per-process singleton.
+    Each engine is driven through an EngineProxy with the methods of RTMapsAbstraction. Arrays and byte strings of
+    at least shared_memory_threshold bytes, in arguments and results, are moved through shared memory instead of
+    being pickled through the pipe.
+
+        with EnginePool(3) as pool:
+            replay, variant_a, variant_b = pool
+            for engine, diagram in zip(pool, ("replay.rtd", "variant_a.rtd", "variant_b.rtd")):
+                engine.load_diagram(diagram)
+            pool.broadcast("run")
+            points, meta = variant_a.read_float64_array_timeout_meta("Lidar_1", "output", 100000, vector_size=100000)
+    """
+    def __init__(self, size, shared_memory_threshold=SHARED_MEMORY_THRESHOLD):
+        context = multiprocessing.get_context("spawn")  # a forked child would share the engine of the parent
+        self.engines = list()
+        try:
+            for index in range(size):
+                self.engines.append(EngineProxy(index, context, shared_memory_threshold))
+            for engine in self.engines:  # the workers initialize their engines in parallel
+                engine._wait_ready()
+        except BaseException:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return len(self.engines)
+
+    def __getitem__(self, index):
+        return self.engines[index]
+
+    def __iter__(self):
+        return iter(self.engines)
+
+    def broadcast(self, method, *args, **kwargs):
+        """ Calls method(*args, **kwargs) on every engine in parallel and returns the results in engine order. """
+        return self.map(method, [(args, kwargs)] * len(self.engines))
+
+    def map(self, method, arguments):
+        """
+        Calls method on every engine in parallel, engine i getting the (args, kwargs) pair arguments[i], and returns
+        the results in engine order. The first exception raised by an engine is raised once all of them replied.
+        """
+        if len(arguments) != len(self.engines):
+            raise RTMapsException("{} argument pairs for {} engines".format(len(arguments), len(self.engines)))
+        for engine in self.engines:
+            engine._lock.acquire()
+        try:
+            results = list()
+            error = None
+            sent = list()
+            for engine, (args, kwargs) in zip(self.engines, arguments):
+                try:
+                    engine._send(method, args, kwargs)
+                    sent.append(True)
+                except Exception as ex:
+                    sent.append(False)
+                    error = error or ex
+            for engine, was_sent in zip(self.engines, sent):
+                try:
+                    results.append(engine._receive(method) if was_sent else None)
+                except Exception as ex:
+                    results.append(None)
+                    error = error or ex
+            if error is not None:
+                raise error
+            return results
+        finally:
+            for engine in self.engines:
+                engine._lock.release()
+
+    def close(self):
+        """ Exits every engine and terminates the worker processes. """
+        for engine in self.engines:
+            engine.close()
+        self.engines = list()
@@ -0,0 +1,141 @@
+# coding=utf-8
+#
+#  Copyright (C) INTEMPORA S.A.S
+#  ALL RIGHTS RESERVED.
+
+import os
+import time
+
+from rtmaps import RTMapsException
+from rtmaps_pool import EnginePool
+
+
+class Shard(object):
+    """ A time range [start, end) of the recording, post-processed by one engine of the pool. """
+    def __init__(self, index, start, end):
+        self.index = index
+        self.start = start
+        self.end = end
+        self.percentage = 0
+        self.done = False
+        self.error = None
+        self.result = None
+        self.finished_after = None  # seconds from the start of the run
+
+    def describe(self):
+        return {"index": self.index, "start": self.start, "end": self.end, "percentage": self.percentage,
+                "finished_after": self.finished_after, "error": self.error, "result": self.result}
+
+
+class ShardedPostProcessor(object):
+    """
+    Post-processes a recording in parallel: the recorded time range is split into shards, and each shard is played
+    by the same diagram in its own engine process (see EnginePool), the player being restricted to the shard with
+    its start and end properties, set with set_property.
+
+    properties ({(component, property): value}) are set in every engine, shard_properties(shard) returns the
+    properties specific to a shard, typically the output file of a recorder. collect(engine, shard), called once the
+    shard is done, returns its result; merge(results) combines the results of all shards into the one of the report.
+
+        processor = ShardedPostProcessor("postprocessing.rtd", "Player_1",
+                                         properties={("Player_1", "file"): rec_path},
+                                         shard_properties=lambda shard: {("Recorder_1", "file"): "out_{}.rec".format(shard.index)})
+        report = processor.run(progress=lambda percentage, shards: print("{:.0f}%".format(percentage)))
+    """
+    def __init__(self, diagram_path, player="Player_1", shards=None, properties=None, shard_properties=None,
+                 collect=None, merge=None, start_property="start", end_property="end", poll_interval=0.5):
+        self.diagram_path = os.path.abspath(diagram_path)
+        self.player = player
+        self.shard_count = shards or os.cpu_count() or 1
+        self.properties = properties or dict()
+        self.shard_properties = shard_properties
+        self.collect = collect
+        self.merge = merge
+        self.start_property = start_property
+        self.end_property = end_property
+        self.poll_interval = poll_interval
+
+    def split(self, first, last):
+        """ Splits [first, last) into contiguous shards of (almost) the same duration. """
+        bounds = [first + (last - first) * i // self.shard_count for i in range(self.shard_count + 1)]
+        return [Shard(i, bounds[i], bounds[i + 1]) for i in range(self.shard_count) if bounds[i + 1] > bounds[i]]
+
+    def run(self, time_range=None, progress=None, timeout=None):
+        """
+        Plays every shard and returns the merged report. time_range is the (first, last) timestamps to process,
+        by default the first and last properties of the player. progress(percentage, shards) is called after each
+        poll of the players, percentage being the overall progress weighted by the duration of the shards. Shards
+        still running timeout seconds after the start of run() are shut down and reported as failed.
+        """
+        start_time = time.monotonic()
+        with EnginePool(self.shard_count) as pool:
+            pool.broadcast("load_diagram", self.diagram_path)
+            for (component_id, property_name), value in self.properties.items():
+                pool.broadcast("set_property", component_id, property_name, value)
+            if time_range is None:
+                time_range = (pool[0].get_integer_property(self.player, "first"),
+                              pool[0].get_integer_property(self.player, "last"))
+            shards = self.split(*time_range)
+            if not shards:
+                raise RTMapsException("Empty time range {}".format(time_range))
+            engines = pool.engines[:len(shards)]
+
+            for engine, shard in zip(engines, shards):
+                self._start(engine, shard)
+            running = [(engine, shard) for engine, shard in zip(engines, shards) if not shard.done]
+            while running:
+                time.sleep(self.poll_interval)
+                timed_out = timeout is not None and time.monotonic() - start_time > timeout
+                for engine, shard in running:
+                    self._poll(engine, shard, start_time, timed_out)
+                running = [(engine, shard) for engine, shard in running if not shard.done]
+                if progress is not None:
+                    progress(self._overall_percentage(shards), shards)
+
+        results = [shard.result for shard in shards]
+        failed = [shard.index for shard in shards if shard.error is not None]
+        return {
+            "diagram": self.diagram_path,
+            "time_range": list(time_range),
+            "duration": time.monotonic() - start_time,
+            "percentage": self._overall_percentage(shards),
+            "failed": failed,
+            "result": self.merge(results) if self.merge is not None and not failed else None,
+            "shards": [shard.describe() for shard in shards],
+        }
+
+    def _start(self, engine, shard):
+        try:
+            engine.set_property(self.player, self.start_property, shard.start)
+            engine.set_property(self.player, self.end_property, shard.end)
+            if self.shard_properties is not None:
+                for (component_id, property_name), value in self.shard_properties(shard).items():
+                    engine.set_property(component_id, property_name, value)
+            engine.run()
+        except Exception as ex:
+            shard.error = "{}: {}".format(type(ex).__name__, ex)
+            shard.done = True
+
+    def _poll(self, engine, shard, start_time, timed_out):
+        try:
+            shard.percentage = engine.get_integer_property(self.player, "percentage")
+            if shard.percentage < 100 and not timed_out:
+                return
+            engine.shutdown()
+            shard.finished_after = time.monotonic() - start_time
+            if shard.percentage < 100:
+                shard.error = "Timeout reached at {}%".format(shard.percentage)
+            elif self.collect is not None:
+                shard.result = self.collect(engine, shard)
+        except Exception as ex:
+            shard.error = "{}: {}".format(type(ex).__name__, ex)
+            try:
+                engine.shutdown()
+            except Exception:
+                pass
+        shard.done = True
+
+    @staticmethod
+    def _overall_percentage(shards):
+        total = sum(shard.end - shard.start for shard in shards)
+        return sum(shard.percentage * (shard.end - shard.start) for shard in shards) / total
@@ -0,0 +1,253 @@
+# coding=utf-8
+#
+#  Copyright (C) INTEMPORA S.A.S
+#  ALL RIGHTS RESERVED.
+
+import json
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+from rtmaps import RTMapsException
+
+_value_dtypes = {
+    "int32": np.int32,
+    "int64": np.int64,
+    "float64": np.float64,
+    "float64_vector": np.float64,
+}
+NO_TIME_OF_ISSUE = -1  # stored for samples read without metadata
+_FLUSH = ("flush", None)  # queued by Recorder.flush()
+
+
+class _Column(object):
+    """ A memory-mapped column file grown by whole chunks; only the first count rows are meaningful. """
+    def __init__(self, path, dtype, shape, chunk_size):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.shape = tuple(shape)
+        self.chunk_size = chunk_size
+        self.capacity = 0
+        self.memmap = None
+        open(path, "wb").close()
+
+    def write(self, offset, rows):
+        end = offset + len(rows)
+        if end > self.capacity:
+            self._grow(end)
+        self.memmap[offset:end] = rows
+
+    def flush(self):
+        if self.memmap is not None:
+            self.memmap.flush()
+
+    def close(self):
+        self.flush()
+        self.memmap = None
+
+    def _grow(self, rows):
+        self.flush()
+        self.capacity = -(-rows // self.chunk_size) * self.chunk_size
+        row_size = self.dtype.itemsize * int(np.prod(self.shape, dtype=np.int64))
+        with open(self.path, "r+b") as file:
+            file.truncate(self.capacity * row_size)
+        self.memmap = np.memmap(self.path, dtype=self.dtype, mode="r+", shape=(self.capacity,) + self.shape)
+
+    def describe(self):
+        return {"file": os.path.basename(self.path), "dtype": self.dtype.str, "shape": list(self.shape)}
+
+
+class _RecordedPort(object):
+    def __init__(self, directory, name, kind, vector_size, chunk_size):
+        os.makedirs(directory, exist_ok=True)
+        self.name = name
+        self.kind = kind
+        self.vector_size = vector_size
+        self.count = 0
+        value_shape = (vector_size,) if kind == "float64_vector" else ()
+        self.columns = {
+            "value": _Column(os.path.join(directory, "value.bin"), _value_dtypes[kind], value_shape, chunk_size),
+            "timestamp": _Column(os.path.join(directory, "timestamp.bin"), np.int64, (), chunk_size),
+            "time_of_issue": _Column(os.path.join(directory, "time_of_issue.bin"), np.int64, (), chunk_size),
+        }
+        if kind == "float64_vector":
+            self.columns["length"] = _Column(os.path.join(directory, "length.bin"), np.int32, (), chunk_size)
+
+    def append(self, samples):
+        timestamps = [sample.timestamp for sample in samples]
+        times_of_issue = [NO_TIME_OF_ISSUE if sample.time_of_issue is None else sample.time_of_issue for sample in samples]
+        if self.kind == "float64_vector":
+            values = np.zeros((len(samples), self.vector_size))
+            lengths = np.empty(len(samples), dtype=np.int32)
+            for row, sample in enumerate(samples):
+                length = min(len(sample.value), self.vector_size)
+                values[row, :length] = sample.value[:length]
+                lengths[row] = length
+            self.columns["length"].write(self.count, lengths)
+        else:
+            values = [sample.value for sample in samples]
+        self.columns["value"].write(self.count, values)
+        self.columns["timestamp"].write(self.count, timestamps)
+        self.columns["time_of_issue"].write(self.count, times_of_issue)
+        self.count += len(samples)
+
+    def describe(self, directory):
+        return {"kind": self.kind, "count": self.count, "directory": directory,
+                "columns": {name: column.describe() for name, column in self.columns.items()}}
+
+
+class Recorder(object):
+    """
+    Records samples captured from Python (RTMapsSample records, see RTMapsWrapper.read_sample) into memory-mapped
+    NumPy column files, one directory per port with value, timestamp and time_of_issue columns (plus length for
+    float64 vectors, stored zero-padded to vector_size). record() only queues the sample; a background writer
+    thread appends the queued samples in batches into files grown by chunks of chunk_size rows. Every
+    flush_interval seconds it flushes the files and updates index.json with the number of rows written, so that
+    open_recording() can read the data while recording goes on.
+
+        recorder = Recorder(maps, "capture")
+        recorder.add_port("Lidar_1.points", "float64_vector", 10000)
+        while running:
+            sample = recorder.read("Lidar_1.points", 100000)
+        recorder.close()
+    """
+    def __init__(self, maps, directory, chunk_size=65536, queue_size=100000, flush_interval=1.0):
+        self.maps = maps
+        self.directory = os.path.abspath(directory)
+        self.chunk_size = chunk_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._ports = dict()
+        self._queue = queue.Queue(queue_size)
+        self._lock = threading.Lock()
+        self._error = None
+        os.makedirs(self.directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="RTMapsRecorder", daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def add_port(self, name, kind="float64", vector_size=None):
+        if kind not in _value_dtypes:
+            raise RTMapsException("{} cannot be recorded. Valid types are: {}".format(kind, tuple(_value_dtypes)))
+        if kind == "float64_vector" and not vector_size:
+            raise RTMapsException("vector_size is needed to record float64 vectors")
+        with self._lock:
+            if name in self._ports:
+                raise RTMapsException("{} is already recorded".format(name))
+            self._ports[name] = _RecordedPort(os.path.join(self.directory, name), name, kind, vector_size, self.chunk_size)
+            self._write_index()
+
+    def read(self, name, timeout):
+        """ Reads a sample of a recorded port through the wrapper, records it and returns it (None on timeout). """
+        port = self._ports[name]
+        sample = self.maps.read_sample(name, port.kind, timeout, port.vector_size)
+        if sample is not None:
+            self.record(name, sample)
+        return sample
+
+    def record(self, name, sample):
+        """ Queues a sample of the port name. Samples arriving while the queue is full are dropped and counted. """
+        if name not in self._ports:
+            raise RTMapsException("{} is not recorded, call add_port first".format(name))
+        try:
+            self._queue.put_nowait((name, sample))
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self):
+        """ Waits until every queued sample is written, flushed and indexed. """
+        self._queue.put(_FLUSH)
+        self._queue.join()
+        self._raise_error()
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        self._raise_error()
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise RTMapsException("Recorder writer failed: {}".format(self._error))
+
+    def _run(self):
+        running = True
+        dirty = False
+        last_flush = time.monotonic()
+        while running:
+            try:
+                items = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                items = []
+            while items and len(items) < self.chunk_size:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            batches = dict()
+            flush_requested = False
+            for item in items:
+                if item is None:
+                    running = False
+                elif item is _FLUSH:
+                    flush_requested = True
+                else:
+                    batches.setdefault(item[0], []).append(item[1])
+            try:
+                with self._lock:
+                    for name, samples in batches.items():
+                        self._ports[name].append(samples)
+                    dirty = dirty or bool(batches)
+                    if dirty and (not running or flush_requested or time.monotonic() - last_flush >= self.flush_interval):
+                        self._flush_files(close=not running)
+                        dirty = False
+                        last_flush = time.monotonic()
+            except Exception as ex:
+                self._error = ex
+            for _ in items:
+                self._queue.task_done()
+
+    def _flush_files(self, close=False):
+        for port in self._ports.values():
+            for column in port.columns.values():
+                if close:
+                    column.close()
+                else:
+                    column.flush()
+        self._write_index()
+
+    def _write_index(self):
+        index = {name: port.describe(name) for name, port in self._ports.items()}
+        temporary_file = os.path.join(self.directory, "index.json.tmp")
+        with open(temporary_file, "w") as file:
+            json.dump(index, file, indent=2)
+        os.replace(temporary_file, os.path.join(self.directory, "index.json"))
+
+
+def open_recording(directory):
+    """
+    Opens the columns written by a Recorder, possibly still recording. Returns {port: {column: numpy.memmap}},
+    each column holding the rows written when index.json was last updated.
+    """
+    with open(os.path.join(directory, "index.json")) as file:
+        index = json.load(file)
+    recording = dict()
+    for name, port in index.items():
+        columns = dict()
+        for column_name, column in port["columns"].items():
+            path = os.path.join(directory, port["directory"], column["file"])
+            if port["count"] == 0:
+                columns[column_name] = np.zeros((0,) + tuple(column["shape"]), dtype=column["dtype"])
+            else:
+                columns[column_name] = np.memmap(path, dtype=column["dtype"], mode="r",
+                                                 shape=(port["count"],) + tuple(column["shape"]))
+        recording[name] = columns
+    return recording
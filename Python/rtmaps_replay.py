@@ -0,0 +1,112 @@
+# coding=utf-8
+#
+#  Copyright (C) INTEMPORA S.A.S
+#  ALL RIGHTS RESERVED.
+
+import time
+
+import numpy as np
+
+from rtmaps import RTMapsException
+from rtmaps_latency import LatencyHistogram
+
+_senders = {
+    np.int32: "send_int32_ts",
+    np.int64: "send_int64_ts",
+    np.float64: "send_float64_ts",
+}
+
+
+class ReplayInjector(object):
+    """
+    Replays recorded samples into diagram inputs, scheduled against the engine clock (get_current_time()).
+
+    Every sample is due at start + (timestamp - first timestamp) / speed, computed from the start of the replay
+    rather than from the previous send, so waiting errors never accumulate into drift. The injector sleeps until
+    shortly before a due time and then polls the engine clock. speed=None replays as fast as possible.
+
+        replay = ReplayInjector(maps)
+        replay.add_input("Control_1.speed", speeds, timestamps)
+        replay.add_input("Control_1.steering", angles, timestamps)
+        print(replay.run(speed=2.0))
+    """
+    def __init__(self, maps, spin_threshold=0.002):
+        self.maps = maps
+        self.spin_threshold = spin_threshold  # seconds before the due time at which sleeping stops
+        self._inputs = list()
+        self._stop_requested = False
+
+    def add_input(self, name, values, timestamps):
+        """ Adds the time-sorted int32, int64 or float64 values with their timestamps (in microseconds) for input name. """
+        values = np.asarray(values)
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        if values.ndim != 1 or values.shape != timestamps.shape:
+            raise RTMapsException("values and timestamps must be one-dimensional arrays of the same length")
+        if values.dtype.type not in _senders:
+            raise RTMapsException("Type {} cannot be replayed. Use int32, int64 or float64".format(values.dtype))
+        if len(timestamps) > 1 and np.any(np.diff(timestamps) < 0):
+            raise RTMapsException("Timestamps of {} are not sorted".format(name))
+        self._inputs.append((name, values, timestamps))
+
+    def stop(self):
+        """ Makes a running replay return after the current sample (may be called from another thread). """
+        self._stop_requested = True
+
+    def run(self, speed=1.0, rebase_timestamps=True, bin_width_us=10, max_lateness_us=1000000):
+        """
+        Replays every input and returns a report: samples sent, accepted and rejected, duration, achieved rate
+        and the lateness distribution (microseconds between due time and send, as a LatencyHistogram summary).
+        With rebase_timestamps, samples are sent with their due engine time, otherwise with their recorded timestamp.
+        """
+        if not self._inputs:
+            raise RTMapsException("Nothing to replay")
+        if speed is not None and speed <= 0:
+            raise RTMapsException("Replay speed must be positive")
+        self._stop_requested = False
+
+        timestamps = np.concatenate([t for name, v, t in self._inputs])
+        order = np.argsort(timestamps, kind="stable")
+        input_index = np.concatenate([np.full(len(t), i, dtype=np.int32) for i, (name, v, t) in enumerate(self._inputs)])[order]
+        sample_index = np.concatenate([np.arange(len(t)) for name, v, t in self._inputs])[order]
+        timestamps = timestamps[order]
+        values = [v.tolist() for name, v, t in self._inputs]
+        senders = [getattr(self.maps.port(name), _senders[v.dtype.type]) for name, v, t in self._inputs]
+
+        get_current_time = self.maps.get_current_time
+        start = get_current_time()
+        if start == 0 and speed is not None:
+            raise RTMapsException("The diagram must be running to replay against the engine clock")
+        first = int(timestamps[0])
+        if speed is None:
+            due_times = timestamps - first + start
+        else:
+            due_times = start + ((timestamps - first) / speed).astype(np.int64)
+
+        lateness = LatencyHistogram(bin_width_us, max_lateness_us)
+        rejected = 0
+        sent = 0
+        for i, s, timestamp, due in zip(input_index.tolist(), sample_index.tolist(), timestamps.tolist(), due_times.tolist()):
+            if self._stop_requested:
+                break
+            now = get_current_time()
+            if speed is not None:
+                while now < due:
+                    remaining = (due - now) / 1e6
+                    if remaining > self.spin_threshold:
+                        time.sleep(remaining - self.spin_threshold)
+                    now = get_current_time()
+                lateness.add(now - due)
+            if senders[i](values[i][s], due if rebase_timestamps else timestamp) != 0:
+                rejected += 1
+            sent += 1
+        duration = (get_current_time() - start) / 1e6
+
+        return {
+            "sent": sent,
+            "accepted": sent - rejected,
+            "rejected": rejected,
+            "duration": duration,
+            "rate": sent / duration if duration > 0 else None,
+            "speed": speed,
+            "lateness": lateness.summary(),
+        }
@@ -12,16 +12,56 @@ import distutils.util
 import textwrap
 import datetime
 import re
+import queue
+import collections
+import threading
+import json
+import signal
+import socket
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
 
 DEATH_TIMEOUT = 1800  # seconds (Timeout to prevent deadlocks when a Death() method never returns)
+REPORT_QUEUE_SIZE = 100000  # RTMaps messages buffered between the report callback and the consumer thread
+REPORT_BATCH_SIZE = 1000  # messages processed (and written) at once by the consumer thread
+LOG_FLUSH_INTERVAL = 0.5  # seconds between two flushes of the log file by the consumer thread
+STATE_POLL_INTERVAL = 0.05  # seconds between two checks of the engine state while waiting for events
+SHUTDOWN_GRACE_TIME = 2  # seconds always given to the components to report LONG_DEATH after the diagram stopped (default of ADT_SHUTDOWN_GRACE_TIME)
+SHUTDOWN_QUIET_TIME = 0.1  # seconds without RTMaps messages after which the component shutdown is considered done
+SHUTDOWN_MAX_WAIT = 2  # seconds, upper bound of the wait for component shutdown after the grace time
+DAEMON_SOCKET = os.path.join(os.path.expanduser("~"), ".rtmaps_runtime_ext.sock")  # default socket of the daemon mode
+BATCH_KILL_GRACE_TIME = 10  # seconds between terminate and kill of a batch job that exceeded its timeout
+
+REPORT_INFO = 0
+REPORT_WARNING = 1
+REPORT_ERROR = 2
+REPORT_CMD = 3
 
 g_errorOccurred = False
 g_timeoutErrorOccurred = False
 g_exitRequest = False
 g_tolerateAllErrors = False
+g_shutdownGraceTime = SHUTDOWN_GRACE_TIME
 g_logFileHandler = None
+g_logStream = None  # socket file of the client of the current daemon job
 g_componentsInDeath = set()
 g_rtmapsFirstErrorMessage = ""
+g_reportQueue = queue.Queue(REPORT_QUEUE_SIZE)
+g_reportOverflowCount = 0
+g_overflowErrors = collections.deque()  # error reports that did not fit in g_reportQueue (unbounded)
+g_processingOverflowErrors = False
+g_reportConsumer = None
+g_logLock = threading.Lock()
+g_stateChanged = threading.Condition()  # notified each time a batch of RTMaps messages has been processed
+g_lastReportTime = time.monotonic()
+
+TOLERATED_ERROR_PATTERN = re.compile(
+    "Error: component .*: (Interrupted|eof|Unable to request data!)|Error: component dSPACE_StructFilter.*|Error: Package .* already registered.*"
+)
+TOLERATED_SHUTDOWN_ERROR_PATTERN = re.compile("Error: component .*: (Got receive exception:|Unable to request data!|Error while processing data: ) .*")
+TIMEOUT_ERROR_PATTERN = re.compile(
+    "Error: component .*: (Timeout reached before packet arrival --> shutting down|Timeout reached before all players are done --> shutting down)"
+)
 
 timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
 
@@ -29,38 +69,55 @@ timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
 __version__ = "1.0.0"
 
 
+def wrapperLogMessage(message):
+    return "[Wrapper][{}] {}".format(datetime.datetime.now(), message)
+
+
+def writeLog(lines, flush=False):
+    """Prints the lines and appends them to the log file, in a single write."""
+    global g_logStream, g_exitRequest
+    text = "\n".join(lines) + "\n"
+    with g_logLock:
+        sys.stdout.write(text)
+        if flush:
+            sys.stdout.flush()
+        if g_logFileHandler:
+            g_logFileHandler.write(text)
+            if flush:
+                g_logFileHandler.flush()
+        if g_logStream:
+            try:
+                sendDaemonMessage(g_logStream, {"log": text})
+            except OSError:  # the client is gone, so its diagram is stopped
+                g_logStream = None
+                g_exitRequest = True
+
+
+def flushLog():
+    with g_logLock:
+        sys.stdout.flush()
+        if g_logFileHandler:
+            g_logFileHandler.flush()
+
+
 def log(message):
     """Writes the message to the log file."""
-    logMessage = "[Wrapper][{}] {}".format(datetime.datetime.now(), message)
-    print(logMessage)
-    if g_logFileHandler:
-        g_logFileHandler.write(logMessage + "\n")
-        g_logFileHandler.flush()
+    writeLog([wrapperLogMessage(message)], flush=True)
 
 
 def errorIsTolerated(message):
     """Checks if the message is an error and is tolerated."""
-    return bool(
-        re.search(
-            "Error: component .*: (Interrupted|eof|Unable to request data!)|Error: component dSPACE_StructFilter.*|Error: Package .* already registered.*",
-            message,
-        )
-    )
+    return bool(TOLERATED_ERROR_PATTERN.search(message))
 
 
 def errorIsToleratedInShutdown(message):
     """Checks if message is an error and is tolerated during shutdown."""
-    return bool(re.search("Error: component .*: (Got receive exception:|Unable to request data!|Error while processing data: ) .*", message))
+    return bool(TOLERATED_SHUTDOWN_ERROR_PATTERN.search(message))
 
 
 def errorIsTimeoutError(message):
     """Checks if the message is a timeout error."""
-    return bool(
-        re.search(
-            "Error: component .*: (Timeout reached before packet arrival --> shutting down|Timeout reached before all players are done --> shutting down)",
-            message,
-        )
-    )
+    return bool(TIMEOUT_ERROR_PATTERN.search(message))
 
 
 def manageDeathMethods(message):
@@ -76,27 +133,30 @@ def manageDeathMethods(message):
 
 
 def onRtmapsReport(dummy, level: int, msg: bytes):
-    """RTMaps message handle."""
-    global g_errorOccurred, g_exitRequest, g_logFileHandler, g_timeoutErrorOccurred, g_rtmapsFirstErrorMessage
-    REPORT_INFO = 0
-    REPORT_WARNING = 1
-    REPORT_ERROR = 2
-    REPORT_CMD = 3
+    """RTMaps message handle. Runs on the engine's reporting thread, so it only queues the raw message."""
+    global g_reportOverflowCount
+    report = (time.time(), level, msg)
+    try:
+        g_reportQueue.put_nowait(report)
+    except queue.Full:
+        if level == REPORT_ERROR:  # errors decide the exit code: never dropped, the consumer processes them first
+            g_overflowErrors.append(report)
+        else:
+            g_reportOverflowCount += 1
 
+
+def processRtmapsReport(reportTime: float, level: int, msg: bytes, lines: list):
+    """Classifies an RTMaps message and appends the resulting log lines to lines."""
+    global g_errorOccurred, g_exitRequest, g_timeoutErrorOccurred, g_rtmapsFirstErrorMessage
     message = msg.decode("utf-8")
     manageDeathMethods(message)
-    logMessage = "[Runtime][{}] {}".format(datetime.datetime.now(), message)
-    print(logMessage)
-
-    if g_logFileHandler:
-        g_logFileHandler.write(logMessage + "\n")
-        g_logFileHandler.flush()
+    lines.append("[Runtime][{}] {}".format(datetime.datetime.fromtimestamp(reportTime), message))
 
     if level == REPORT_ERROR:
         if g_tolerateAllErrors or errorIsTolerated(message) or (g_exitRequest and errorIsToleratedInShutdown(message)):
-            log("Ignoring this error, because it is explicitly tolerated.")
+            lines.append(wrapperLogMessage("Ignoring this error, because it is explicitly tolerated."))
         else:
-            log("TRIGGERING ABORT due to unexpected error ...")
+            lines.append(wrapperLogMessage("TRIGGERING ABORT due to unexpected error ..."))
             if not g_rtmapsFirstErrorMessage:
                 g_rtmapsFirstErrorMessage = message
             if errorIsTimeoutError(message):
@@ -109,6 +169,98 @@ def onRtmapsReport(dummy, level: int, msg: bytes):
         g_exitRequest = True
 
 
+def consumeRtmapsReports():
+    """Consumer thread: processes queued RTMaps messages in batches until it gets None."""
+    global g_processingOverflowErrors
+    lastFlush = time.monotonic()
+    running = True
+    while running:
+        overflowErrors = []
+        if g_overflowErrors:
+            g_processingOverflowErrors = True  # set before popping, so that waitForReports sees them until logged
+            while g_overflowErrors:
+                overflowErrors.append(g_overflowErrors.popleft())
+        try:
+            reports = [g_reportQueue.get(timeout=0 if overflowErrors else LOG_FLUSH_INTERVAL)]
+        except queue.Empty:
+            reports = []
+        while reports and len(reports) < REPORT_BATCH_SIZE:
+            try:
+                reports.append(g_reportQueue.get_nowait())
+            except queue.Empty:
+                break
+        lines = []
+        for report in overflowErrors + reports:
+            if report is None:
+                running = False
+                break
+            try:
+                processRtmapsReport(*report, lines)
+            except Exception as ex:
+                lines.append(wrapperLogMessage("Failed to process RTMaps message: {}".format(ex)))
+        if lines:
+            writeLog(lines)
+        if reports or overflowErrors:
+            notifyStateChanged()
+        g_processingOverflowErrors = False
+        for _ in reports:
+            g_reportQueue.task_done()
+        if not running or time.monotonic() - lastFlush >= LOG_FLUSH_INTERVAL:
+            flushLog()
+            lastFlush = time.monotonic()
+
+
+def notifyStateChanged():
+    """Wakes up the main thread waiting for errors, exit requests or DEATH_FINISHED messages."""
+    global g_lastReportTime
+    with g_stateChanged:
+        g_lastReportTime = time.monotonic()
+        g_stateChanged.notify_all()
+
+
+def waitForComponentShutdown():
+    """
+    Waits for the grace time (ADT_SHUTDOWN_GRACE_TIME), then until no RTMaps message arrived for SHUTDOWN_QUIET_TIME,
+    at most SHUTDOWN_MAX_WAIT more. Components may report LONG_DEATH after a silence, which only the grace time covers.
+    """
+    graceEnd = time.monotonic() + g_shutdownGraceTime
+    deadline = graceEnd + SHUTDOWN_MAX_WAIT
+    while True:
+        now = time.monotonic()
+        quietTime = now - g_lastReportTime
+        if now < graceEnd:
+            time.sleep(graceEnd - now)
+            continue
+        if quietTime >= SHUTDOWN_QUIET_TIME or now >= deadline:
+            return
+        time.sleep(min(SHUTDOWN_QUIET_TIME - quietTime, deadline - now))
+
+
+def waitForReports():
+    """Blocks until every RTMaps message queued so far has been processed."""
+    if g_reportConsumer:
+        g_reportQueue.join()
+        while g_overflowErrors or g_processingOverflowErrors:
+            time.sleep(STATE_POLL_INTERVAL)
+
+
+def startReportConsumer():
+    global g_reportConsumer
+    g_reportConsumer = threading.Thread(target=consumeRtmapsReports, name="RTMapsReportConsumer", daemon=True)
+    g_reportConsumer.start()
+
+
+def stopReportConsumer():
+    """Processes the messages still queued, then stops the consumer thread."""
+    global g_reportConsumer
+    if g_reportConsumer:
+        g_reportQueue.put(None)
+        g_reportConsumer.join()
+        g_reportConsumer = None
+    if g_reportOverflowCount:
+        log("{} RTMaps messages were dropped because the report queue was full".format(g_reportOverflowCount))
+
+
 def diagramIsRunning(maps):
     """Returns RTMaps diagram state."""
     return maps.get_current_time() != 0
@@ -132,9 +284,87 @@ def appendTimeStampToLogFile(logFile: str):
         return None
 
 
+def readTolerateAllErrors(tolerateAllErrorsEnvVar):
+    """Returns the truth value of the ADT_TOLERATE_RTMAPS_ERRORS environment variable (False if unset)."""
+    if tolerateAllErrorsEnvVar is None:
+        return False
+    try:
+        return bool(distutils.util.strtobool(tolerateAllErrorsEnvVar))
+    except:
+        raise Exception("Environment variable ADT_TOLERATE_RTMAPS_ERRORS has invalid truth value '{}'".format(tolerateAllErrorsEnvVar))
+
+
+def readShutdownGraceTime(shutdownGraceTimeEnvVar):
+    """Returns the seconds of the ADT_SHUTDOWN_GRACE_TIME environment variable (SHUTDOWN_GRACE_TIME if unset)."""
+    if shutdownGraceTimeEnvVar is None:
+        return SHUTDOWN_GRACE_TIME
+    try:
+        graceTime = float(shutdownGraceTimeEnvVar)
+    except ValueError:
+        graceTime = -1
+    if graceTime < 0:
+        raise Exception("Environment variable ADT_SHUTDOWN_GRACE_TIME has invalid value '{}'".format(shutdownGraceTimeEnvVar))
+    return graceTime
+
+
+def logException(ex: Exception):
+    """Logs an exception of the wrapper and records it as an error."""
+    global g_errorOccurred, g_rtmapsFirstErrorMessage
+    log("Exception '{}': {}".format(type(ex).__name__, str(ex)))
+    if not g_rtmapsFirstErrorMessage:  # reported in the error summary (first error of batch and daemon jobs)
+        g_rtmapsFirstErrorMessage = "Exception '{}': {}".format(type(ex).__name__, str(ex))
+    g_errorOccurred = True
+
+
+def runDiagram(maps, diagramFile: str):
+    """Loads the diagram, runs it until it stops, an error is reported or exit is requested, and shuts it down."""
+    log("Loading diagram")
+    maps.load_diagram(diagramFile)
+    waitForReports()
+    if not diagramIsRunning(maps) and not g_errorOccurred:
+        log("Diagram is not running --> calling 'run'")
+        maps.run()
+    shutdownRequested = False
+    while diagramIsRunning(maps):
+        if shutdownRequested:
+            time.sleep(STATE_POLL_INTERVAL)
+            continue
+        with g_stateChanged:
+            g_stateChanged.wait_for(lambda: g_errorOccurred or g_exitRequest, STATE_POLL_INTERVAL)
+        if g_errorOccurred:
+            log("Stopping diagram, because an error was reported!")
+            maps.shutdown()
+            shutdownRequested = True
+        elif g_exitRequest:
+            log("Stopping diagram, because exit was requested")
+            maps.shutdown()
+            shutdownRequested = True
+
+    log("Waiting for component shutdown")
+    waitForReports()
+    waitForComponentShutdown()
+
+
+def waitForDeathMethods():
+    """Waits for DEATH_FINISHED from all registered death methods."""
+    global g_errorOccurred
+    with g_stateChanged:
+        deathFinished = g_stateChanged.wait_for(lambda: not g_componentsInDeath or g_errorOccurred, DEATH_TIMEOUT)
+    if not deathFinished:
+        g_errorOccurred = True
+        log(f"Death timeout while {g_componentsInDeath} is still in Death() method.")
+
+
+def getExitCode():
+    """0=success, 1=error occurred, 2=timeout error occurred."""
+    if g_errorOccurred:
+        return 2 if g_timeoutErrorOccurred else 1
+    return 0
+
+
 def main(diagramFile: str, logFile: str):
     """Main method for the execution of the RTMaps diagram/script."""
-    global g_errorOccurred, g_exitRequest, g_tolerateAllErrors, g_logFileHandler, g_timeoutErrorOccurred
+    global g_exitRequest, g_tolerateAllErrors, g_shutdownGraceTime, g_logFileHandler
 
     logFile = appendTimeStampToLogFile(logFile)
     if logFile:
@@ -144,53 +374,26 @@ def main(diagramFile: str, logFile: str):
     try:
         diagramFile = os.path.abspath(diagramFile)
         os.chdir(os.path.dirname(diagramFile))
-
-        tolerateAllErrorsEnvVar = os.getenv("ADT_TOLERATE_RTMAPS_ERRORS")
-        if tolerateAllErrorsEnvVar is not None:
-            try:
-                g_tolerateAllErrors = bool(distutils.util.strtobool(tolerateAllErrorsEnvVar))
-            except:
-                raise Exception("Environment variable ADT_TOLERATE_RTMAPS_ERRORS has invalid truth value '{}'".format(tolerateAllErrorsEnvVar))
+        g_tolerateAllErrors = readTolerateAllErrors(os.getenv("ADT_TOLERATE_RTMAPS_ERRORS"))
+        g_shutdownGraceTime = readShutdownGraceTime(os.getenv("ADT_SHUTDOWN_GRACE_TIME"))
 
         log("Initializing RTMaps engine")
         maps = RTMapsAbstraction()
+        startReportConsumer()
         maps.register_report_reader(onRtmapsReport)
-        log("Loading diagram")
-        maps.load_diagram(diagramFile)
-        if not diagramIsRunning(maps) and not g_errorOccurred:
-            log("Diagram is not running --> calling 'run'")
-            maps.run()
-        while diagramIsRunning(maps):
-            time.sleep(1)
-            if g_errorOccurred:
-                log("Stopping diagram, because an error was reported!")
-                maps.shutdown()
-            if g_exitRequest:
-                log("Stopping diagram, because exit was requested")
-                maps.shutdown()
-
-        log("Waiting for component shutdown")
-        time.sleep(2)
+        runDiagram(maps, diagramFile)
     except Exception as ex:
-        log("Exception '{}': {}".format(type(ex).__name__, str(ex)))
-        g_errorOccurred = True
+        logException(ex)
     except KeyboardInterrupt:
         log("Exit/Keyboard interrupt occurred")
         g_exitRequest = True
         if maps:
             maps.shutdown()
 
-    waitForDeathStarted = datetime.datetime.now()
-    while g_componentsInDeath and not g_errorOccurred:  # waiting for DEATH_FINISHED from all registered death methods
-        if datetime.datetime.now() - waitForDeathStarted > datetime.timedelta(seconds=DEATH_TIMEOUT):
-            g_errorOccurred = True
-            log(f"Death timeout while {g_componentsInDeath} is still in Death() method.")
-            break
-        time.sleep(1)
+    waitForDeathMethods()
+    stopReportConsumer()
 
-    exitCode = 0
-    if g_errorOccurred:
-        exitCode = 2 if g_timeoutErrorOccurred else 1
+    exitCode = getExitCode()
     log("Terminating process with exit code {}".format(exitCode))
     if g_logFileHandler:
         g_logFileHandler.close()
@@ -199,13 +402,14 @@ def main(diagramFile: str, logFile: str):
     return exitCode
 
 
-def logErrorSummary(errorMessage: str):
+def logErrorSummary(errorMessage: str, writeStderr: bool = True):
     """
     Creates error summary with the from the provided error message.
     Reformats the error output to more easily point the user to the problem.
+    Returns the summary written to stderr.
     """
     if not errorMessage:
-        return
+        return ""
 
     errorMessageLines = errorMessage.splitlines()
 
@@ -216,10 +420,355 @@ def logErrorSummary(errorMessage: str):
     for line in errorMessageLines:
         log(f"# {line}")
     log("######################")
-    sys.stderr.write("\n".join(errorMessageLines))
+    if writeStderr:
+        sys.stderr.write("\n".join(errorMessageLines))
+    return "\n".join(errorMessageLines)
+
+
+def sendDaemonMessage(stream, message: dict):
+    """Sends a message of the daemon protocol: one JSON object per line."""
+    stream.write((json.dumps(message) + "\n").encode("utf-8"))
+    stream.flush()
+
+
+def resetJobState():
+    """Clears the error and exit state left by the previous daemon job."""
+    global g_errorOccurred, g_timeoutErrorOccurred, g_exitRequest, g_rtmapsFirstErrorMessage
+    g_errorOccurred = False
+    g_timeoutErrorOccurred = False
+    g_exitRequest = False
+    g_rtmapsFirstErrorMessage = ""
+    g_componentsInDeath.clear()
+
+
+def watchDaemonClient(connection):
+    """Requests the exit of the current daemon job as soon as its client disconnects."""
+    global g_exitRequest
+    try:
+        while connection.recv(4096):
+            pass
+    except OSError:
+        pass
+    g_exitRequest = True
+    notifyStateChanged()
+
+
+def runDaemonJob(maps, request: dict, stream):
+    """Runs the diagram of a daemon job, streaming its log to the client, and resets the engine afterwards."""
+    global g_tolerateAllErrors, g_shutdownGraceTime, g_logFileHandler, g_logStream
+    waitForReports()  # messages of the previous job must not be attributed to this one
+    resetJobState()
+    with g_logLock:
+        g_logStream = stream
+        if request.get("logFile"):
+            g_logFileHandler = open(request["logFile"], "a")
+    try:
+        diagramFile = os.path.abspath(request["file"])
+        os.chdir(os.path.dirname(diagramFile))
+        g_tolerateAllErrors = readTolerateAllErrors(request.get("tolerateAllErrors"))
+        g_shutdownGraceTime = readShutdownGraceTime(request.get("shutdownGraceTime"))
+        runDiagram(maps, diagramFile)
+    except Exception as ex:
+        logException(ex)
+    waitForDeathMethods()
+
+    exitCode = getExitCode()
+    log("Job finished with exit code {}".format(exitCode))
+    errorSummary = logErrorSummary(g_rtmapsFirstErrorMessage, writeStderr=False)
+    log("Resetting RTMaps engine")
+    maps.reset()
+    waitForReports()
+    with g_logLock:
+        logStream = g_logStream
+        g_logStream = None
+        if g_logFileHandler:
+            g_logFileHandler.close()
+            g_logFileHandler = None
+    if logStream:
+        try:
+            sendDaemonMessage(logStream, {"exitCode": exitCode, "errorSummary": errorSummary})
+        except OSError:
+            pass
+
+
+def daemon(socketPath: str):
+    """
+    Keeps one initialized RTMaps engine and runs the diagram jobs sent by clients (see submit()) on a local Unix
+    socket, one at a time. The engine is reset between two jobs instead of being exited.
+    """
+    socketPath = os.path.abspath(socketPath)
+    if os.path.exists(socketPath):
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+                probe.connect(socketPath)
+            log("A daemon is already listening on {}".format(socketPath))
+            return 1
+        except ConnectionRefusedError:  # left over by a daemon that did not terminate properly
+            os.remove(socketPath)
+
+    signal.signal(signal.SIGTERM, signal.default_int_handler)  # stops the daemon like Ctrl+C
+    log("Initializing RTMaps engine")
+    maps = RTMapsAbstraction()
+    startReportConsumer()
+    maps.register_report_reader(onRtmapsReport)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        server.bind(socketPath)
+        server.listen()
+        log("Waiting for jobs on {}".format(socketPath))
+        while True:
+            connection = server.accept()[0]
+            stream = connection.makefile("rwb")
+            try:
+                request = json.loads(stream.readline())
+                log("Running job {}".format(request.get("file")))
+                watcher = threading.Thread(target=watchDaemonClient, args=(connection,), name="RTMapsDaemonClient", daemon=True)
+                watcher.start()
+                runDaemonJob(maps, request, stream)
+            except ValueError:
+                watcher = None  # not a client, or a client that disconnected before sending its job
+            finally:
+                try:
+                    connection.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+                if watcher:
+                    watcher.join()
+                try:
+                    stream.close()
+                except OSError:  # unsent data of a client that disconnected
+                    pass
+                connection.close()
+    except KeyboardInterrupt:
+        log("Exit/Keyboard interrupt occurred, stopping the daemon")
+        maps.shutdown()
+    finally:
+        server.close()
+        if os.path.exists(socketPath):
+            os.remove(socketPath)
+        stopReportConsumer()
+    return 0
+
+
+def submit(diagramFile: str, logFile: str, socketPath: str):
+    """Runs the diagram in the daemon listening on socketPath, prints its log and returns its exit code."""
+    request = {
+        "file": os.path.abspath(diagramFile),
+        "logFile": appendTimeStampToLogFile(logFile),
+        "tolerateAllErrors": os.getenv("ADT_TOLERATE_RTMAPS_ERRORS"),
+        "shutdownGraceTime": os.getenv("ADT_SHUTDOWN_GRACE_TIME"),
+    }
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(socketPath)
+        with connection.makefile("rwb") as stream:
+            sendDaemonMessage(stream, request)
+            for line in stream:
+                message = json.loads(line)
+                if "log" in message:
+                    sys.stdout.write(message["log"])
+                    sys.stdout.flush()
+                elif "exitCode" in message:
+                    if message["errorSummary"]:
+                        sys.stderr.write(message["errorSummary"])
+                    return message["exitCode"]
+    log("Connection to the daemon lost before the end of the job")
+    return 1
+
+
+def daemonCli(argList):
+    description = textwrap.dedent(
+        """
+        Starts a daemon which initializes the RTMaps engine once and then runs diagrams or scripts sent by
+        "rtmaps_runtime_ext.py submit" on a local Unix socket, one at a time. The engine is reset between two
+        jobs. Stop the daemon with Ctrl+C or SIGTERM.
+    """
+    )
+    parser = argparse.ArgumentParser(prog="rtmaps_runtime_ext.py daemon", description=description, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--socket", type=str, default=DAEMON_SOCKET, help="Path of the Unix socket (default: %(default)s)")
+    args = parser.parse_args(argList)
+    sys.exit(daemon(args.socket))
+
+
+def submitCli(argList):
+    description = textwrap.dedent(
+        """
+        Runs a diagram or script in a daemon started with "rtmaps_runtime_ext.py daemon". The log of the job
+        is printed (and written to the log file) and the exit code is the one of a direct execution.
+    """
+    )
+    parser = argparse.ArgumentParser(prog="rtmaps_runtime_ext.py submit", description=description, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("file", type=str, help="Script or diagram to be executed")
+    parser.add_argument("--socket", type=str, default=DAEMON_SOCKET, help="Path of the Unix socket (default: %(default)s)")
+    parser.add_argument("--logfile", type=str, required=False, help="Path to log file in which the rtmaps runtime log should be saved.")
+    args = parser.parse_args(argList)
+    sys.exit(submit(args.file, args.logfile, args.socket))
+
+
+def readManifest(manifestFile: str):
+    """Returns the diagrams listed in a manifest: one path per line, relative to the manifest, '#' starts a comment."""
+    manifestDir = os.path.dirname(os.path.abspath(manifestFile))
+    diagrams = []
+    with open(manifestFile) as manifest:
+        for line in manifest:
+            line = line.split("#", 1)[0].strip()
+            if line:
+                diagrams.append(os.path.join(manifestDir, line))
+    return diagrams
+
+
+def parseCpuList(cpus: str):
+    """Parses a CPU list like '0-3,6,8-9' into a list of CPU numbers."""
+    cpuList = []
+    for part in cpus.split(","):
+        first, _, last = part.strip().partition("-")
+        cpuList.extend(range(int(first), int(last or first) + 1))
+    return cpuList
+
+
+def runBatchJob(index: int, diagramFile: str, logDir: str, slots: queue.Queue, jobTimeout: float):
+    """Runs one diagram in its own rtmaps_runtime_ext process, pinned to the CPUs of a free worker slot."""
+    slotCpus = slots.get()
+    try:
+        startTime = datetime.datetime.now()
+        diagramName = os.path.splitext(os.path.basename(diagramFile))[0]
+        logFile = os.path.join(logDir, "{}_{:04d}_{}.log".format(startTime.strftime("%Y%m%d_%H%M%S"), index, diagramName))
+        firstError = None
+        with open(logFile, "w") as logFileHandler:
+            try:
+                process = subprocess.Popen(
+                    [sys.executable, "-u", os.path.abspath(__file__), diagramFile],  # unbuffered: nothing lost if terminated
+                    stdout=logFileHandler, stderr=subprocess.PIPE, stdin=subprocess.DEVNULL,
+                )
+                if slotCpus and hasattr(os, "sched_setaffinity"):
+                    # Pinned right after the start: the engine threads, created later, inherit the affinity
+                    os.sched_setaffinity(process.pid, slotCpus)
+                stderr = process.communicate(timeout=jobTimeout)[1]
+                exitCode = process.returncode
+            except OSError as ex:
+                stderr = b""
+                exitCode = 1
+                firstError = "Failed to start the job: {}".format(ex)
+            except subprocess.TimeoutExpired:
+                process.terminate()
+                try:
+                    stderr = process.communicate(timeout=BATCH_KILL_GRACE_TIME)[1]
+                except subprocess.TimeoutExpired:
+                    process.kill()
+                    stderr = process.communicate()[1]
+                exitCode = 2
+                firstError = "Job timeout reached after {} s".format(jobTimeout)
+        stderr = stderr.decode("utf-8", errors="replace").strip()
+        if exitCode < 0:
+            firstError = "Process terminated by signal {}".format(-exitCode)
+            exitCode = 1
+        if exitCode and not firstError:
+            firstError = stderr or "Exit code {} without error message, see the log file".format(exitCode)
+        return {
+            "file": diagramFile,
+            "exitCode": exitCode,
+            "firstError": firstError,
+            "log": logFile,
+            "cpus": slotCpus,
+            "start": startTime.isoformat(),
+            "duration": (datetime.datetime.now() - startTime).total_seconds(),
+        }
+    finally:
+        slots.put(slotCpus)
+
+
+def runBatch(diagramFiles: list, logDir: str, concurrency: int = None, cpus: list = None, jobTimeout: float = None):
+    """
+    Runs the diagrams in separate processes, at most concurrency at a time (default: one per CPU), since the
+    RTMaps engine can only be initialized once per process. With cpus, each of the concurrency worker slots is
+    pinned to its share of these CPUs. Returns the report: one entry per diagram, in order, and a summary.
+    """
+    concurrency = concurrency or len(cpus or []) or os.cpu_count() or 1
+    logDir = os.path.abspath(logDir)
+    os.makedirs(logDir, exist_ok=True)
+    slots = queue.Queue()
+    for slot in range(concurrency):
+        slots.put((cpus[slot::concurrency] or [cpus[slot % len(cpus)]]) if cpus else None)
+    if cpus and not hasattr(os, "sched_setaffinity"):
+        log("CPU affinity is not supported on this platform, ignoring --cpus")
+    elif cpus and not set(cpus) <= os.sched_getaffinity(0):
+        raise ValueError("CPUs {} are not available".format(sorted(set(cpus) - os.sched_getaffinity(0))))
+
+    startTime = datetime.datetime.now()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [
+            executor.submit(runBatchJob, index, os.path.abspath(diagramFile), logDir, slots, jobTimeout)
+            for index, diagramFile in enumerate(diagramFiles)
+        ]
+        jobs = []
+        for future in futures:
+            job = future.result()
+            log("{} finished with exit code {} ({})".format(job["file"], job["exitCode"], job["log"]))
+            jobs.append(job)
+
+    exitCodes = [job["exitCode"] for job in jobs]
+    exitCode = 0
+    if any(exitCodes):
+        exitCode = 1 if any(code not in (0, 2) for code in exitCodes) else 2
+    return {
+        "exitCode": exitCode,
+        "summary": {
+            "total": len(jobs),
+            "succeeded": exitCodes.count(0),
+            "failed": len(jobs) - exitCodes.count(0) - exitCodes.count(2),
+            "timedOut": exitCodes.count(2),
+            "start": startTime.isoformat(),
+            "duration": (datetime.datetime.now() - startTime).total_seconds(),
+        },
+        "jobs": jobs,
+    }
+
+
+def batchCli(argList):
+    description = textwrap.dedent(
+        """
+        Runs several RTMaps diagrams or scripts, each one in its own rtmaps_runtime_ext process, with a
+        configurable number of parallel jobs. Each job writes a timestamped log file into the log directory.
+        The exit codes and first errors of all jobs are aggregated into a JSON report. The exit code of the
+        batch is 0 if every job succeeded, 2 if all failed jobs were timeouts and 1 otherwise.
+    """
+    )
+    parser = argparse.ArgumentParser(prog="rtmaps_runtime_ext.py batch", description=description, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", type=str, nargs="*", help="Scripts or diagrams to be executed")
+    parser.add_argument("--manifest", type=str, action="append", default=[], help="File listing one script or diagram per line")
+    parser.add_argument("--jobs", "-j", type=int, default=None, help="Number of diagrams executed in parallel (default: number of CPUs)")
+    parser.add_argument("--cpus", type=parseCpuList, default=None, help="CPUs the jobs are pinned to, e.g. '0-3,6' (Linux only)")
+    parser.add_argument("--job-timeout", dest="jobTimeout", type=float, default=None, help="Seconds after which a job is killed and counted as a timeout")
+    parser.add_argument("--logdir", type=str, default="logs", help="Directory receiving the log file of each job")
+    parser.add_argument("--report", type=str, default=None, help="Path of the JSON report (default: <logdir>/<timestamp>_batch_report.json)")
+    args = parser.parse_args(argList)
+
+    diagramFiles = list(args.files)
+    for manifestFile in args.manifest:
+        diagramFiles.extend(readManifest(manifestFile))
+    if not diagramFiles:
+        parser.error("no diagram to execute")
+    if args.cpus and hasattr(os, "sched_getaffinity"):
+        unavailableCpus = sorted(set(args.cpus) - os.sched_getaffinity(0))
+        if unavailableCpus:
+            parser.error("CPUs {} are not available".format(unavailableCpus))
+
+    report = runBatch(diagramFiles, args.logdir, args.jobs, args.cpus, args.jobTimeout)
+    reportFile = args.report or os.path.join(args.logdir, "{}_batch_report.json".format(timestamp))
+    with open(reportFile, "w") as reportFileHandler:
+        json.dump(report, reportFileHandler, indent=2)
+    summary = report["summary"]
+    log("{} succeeded, {} failed, {} timed out, report written to {}".format(
+        summary["succeeded"], summary["failed"], summary["timedOut"], os.path.abspath(reportFile)))
+    sys.exit(report["exitCode"])
 
 
 def cli(argList):
+    if argList and argList[0] == "batch":
+        batchCli(argList[1:])
+    if argList and argList[0] == "daemon":
+        daemonCli(argList[1:])
+    if argList and argList[0] == "submit":
+        submitCli(argList[1:])
     description = textwrap.dedent(
         """
         This script implements an "extended" runtime wrapper to execute RTMaps diagrams and scripts.
@@ -229,9 +778,14 @@ def cli(argList):
         started.
         For compatibility with rtmaps_runtime.exe, the optional arguments "--run" and "--no-X11"
         are allowed but have no effect.
+        Several diagrams can be executed in parallel with "rtmaps_runtime_ext.py batch", and
+        without engine startup time with "rtmaps_runtime_ext.py daemon" and "rtmaps_runtime_ext.py
+        submit", see "--help" of these commands.
         
         Environment variables:
           ADT_TOLERATE_RTMAPS_ERRORS  If set to "true" or "1", an error will not cause a shutdown                 
+          ADT_SHUTDOWN_GRACE_TIME     Seconds given to the components to start their Death() method once the
+                                      diagram stopped (default: 2)
     """
     )
     parser = argparse.ArgumentParser(description=description, formatter_class=argparse.RawDescriptionHelpFormatter)
@@ -0,0 +1,558 @@
+# coding=utf-8
+#
+#  Copyright (C) INTEMPORA S.A.S
+#  ALL RIGHTS RESERVED.
+
+import ctypes
+import random
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from rtmaps import DiagramIndex, RTMapsException, sample_kinds
+
+REPORT_INFO = 0
+REPORT_WARNING = 1
+REPORT_ERROR = 2
+REPORT_CMD = 3
+_CArgObject = type(ctypes.byref(ctypes.c_int()))
+
+
+def _target(argument):
+    """ The ctypes object behind an argument passed by the wrapper: byref(x) gives x, anything else itself. """
+    return argument._obj if isinstance(argument, _CArgObject) else argument
+
+
+def _address(argument):
+    """ Address of a buffer passed by the wrapper as an integer address, a byref() reference or a ctypes object. """
+    if isinstance(argument, int):
+        return argument
+    return ctypes.addressof(_target(argument))
+
+
+def _put_string(value, buffer, size_ref):
+    """ Same convention as the string getters of librtmaps: the needed size is returned, -1 if it does not fit. """
+    data = value.encode("utf-8") + b"\0"
+    size = _target(size_ref)
+    if buffer is None or size.value < len(data):
+        size.value = len(data)
+        return -1 if buffer is not None else 0
+    ctypes.memmove(buffer, data, len(data))
+    size.value = len(data)
+    return 0
+
+
+class SimulatedModel(object):
+    """ Ports, properties (name -> default value) and actions of a component model known to the SimulatedEngine. """
+    def __init__(self, outputs=(), inputs=(), properties=None, enums=None, actions=()):
+        self.outputs = tuple(outputs)
+        self.inputs = tuple(inputs)
+        self.properties = dict(properties or {})
+        self.enums = dict(enums or {})  # property -> list of values
+        self.actions = tuple(actions)
+
+
+class SimulatedProducer(object):
+    """
+    Samples of a simulated output, issued at rate Hz from the start of the diagram. Sample n has the timestamp
+    start + n / rate; its time of issue is shifted by up to +/- jitter / 2 periods (jitter in [0, 1]). Like an
+    RTMaps FIFO, only the last fifosize samples can be read: a reader falling behind loses the oldest ones.
+    generator(index, timestamp) returns the value of a sample; by default, the index (scalars), a vector of
+    vector_size times the index, the text "sample <index>" or vector_size bytes equal to the index modulo 256.
+    """
+    def __init__(self, kind="float64", rate=100.0, vector_size=16, jitter=0.0, fifosize=16, generator=None, seed=0):
+        if kind not in sample_kinds:
+            raise RTMapsException("{} is not a valid sample type. Valid types are: {}".format(kind, sample_kinds))
+        if rate <= 0:
+            raise RTMapsException("Producer rate must be positive")
+        self.kind = kind
+        self.rate = float(rate)
+        self.vector_size = int(vector_size)
+        self.jitter = min(max(float(jitter), 0.0), 1.0)
+        self.fifosize = max(int(fifosize), 1)
+        self.generator = generator
+        self.seed = seed
+        self.period = 1e6 / self.rate  # microseconds
+        self.start(0)
+
+    def start(self, origin):
+        self._origin = origin
+        self._random = random.Random(self.seed)
+        self._cursor = 0
+        self._offset = self._draw_offset()
+        self.produced = 0
+
+    def _draw_offset(self):
+        return (self._random.random() - 0.5) * self.jitter * self.period if self.jitter else 0.0
+
+    def timestamp(self, index):
+        return self._origin + int(index * self.period)
+
+    def next_issue_time(self, now):
+        """ Time of issue of the next sample to read, after dropping the samples pushed out of the FIFO. """
+        latest = int((now - self._origin) / self.period)
+        if latest - self._cursor >= self.fifosize:
+            self._cursor = latest - self.fifosize + 1
+            self._offset = self._draw_offset()
+        return self.timestamp(self._cursor) + int(self._offset)
+
+    def take(self):
+        """ Returns (index, timestamp, time of issue, value) of the next sample and moves to the following one. """
+        index = self._cursor
+        timestamp = self.timestamp(index)
+        issued = timestamp + int(self._offset)
+        self._cursor += 1
+        self._offset = self._draw_offset()
+        self.produced += 1
+        return index, timestamp, max(issued, self._origin), self.value(index, timestamp)
+
+    def value(self, index, timestamp):
+        if self.generator is not None:
+            return self.generator(index, timestamp)
+        if self.kind == "float64_vector":
+            return np.full(self.vector_size, float(index))
+        if self.kind == "stream8":
+            return bytes((index % 256,)) * self.vector_size
+        if self.kind == "text":
+            return "sample {}".format(index)
+        return index
+
+
+class SimulatedEngine(object):
+    """
+    In-process stand-in for librtmaps, to be given as backend to RTMapsWrapper or RTMapsAbstraction: it provides
+    the maps_* functions with the same arguments, so every feature of the wrapper works without RTMaps.
+
+    parse() handles component additions and kills, connections, property assignments, actions, run, shutdown,
+    reset and loaddiagram (.rtd and .rtm, through DiagramIndex); each command is reported with level 3, failures
+    with level 2. Outputs are fed by SimulatedProducer instances, added with add_producer() or declared in the
+    diagram as SimulatedProducer components (properties kind, rate, vector_size, jitter, fifosize and seed; output
+    "output"). Reads wait for the next sample up to their timeout, on the engine clock (microseconds since run);
+    a read of another type than the producer's converts the value and samples larger than the read buffer are
+    truncated. Values sent to inputs are kept in received().
+
+        engine = SimulatedEngine()
+        engine.add_producer("Lidar_1.points", "float64_vector", rate=20, vector_size=100000, jitter=0.1)
+        maps = RTMapsAbstraction(backend=engine)
+        maps.load_diagram("lidar.rtd")
+        maps.run()
+        points, meta = maps.read_float64_array_timeout_meta("Lidar_1", "points", 100000, vector_size=100000)
+    """
+    rtmaps_install_path = ""
+
+    def __init__(self, models=None, received_size=10000):
+        self.models = {
+            "SimulatedProducer": SimulatedModel(
+                outputs=("output",),
+                properties={"kind": "float64", "rate": "100", "vector_size": "16", "jitter": "0", "fifosize": "16", "seed": "0"},
+                enums={"kind": list(sample_kinds)}),
+            "SimulatedConsumer": SimulatedModel(inputs=("input",)),
+        }
+        self.models.update(models or {})
+        self.diagram = DiagramIndex(None)
+        self.producers = dict()  # "Component.output" -> SimulatedProducer
+        self._diagram_producers = set()  # outputs of SimulatedProducer components
+        self._received = dict()  # "Component.input" -> deque of (value, timestamp)
+        self._received_size = received_size
+        self._lock = threading.Lock()
+        self._running = False
+        self._paused = False
+        self._origin = 0.0
+        self._report_reader = None
+
+    # Configuration (Python side)
+
+    def add_producer(self, name, kind="float64", rate=100.0, vector_size=16, jitter=0.0, fifosize=16, generator=None, seed=0):
+        """ Feeds the output name ("Component.output") with a SimulatedProducer and returns it. """
+        producer = SimulatedProducer(kind, rate, vector_size, jitter, fifosize, generator, seed)
+        with self._lock:
+            self.producers[name] = producer
+            if self._running:
+                producer.start(self._now())
+        return producer
+
+    def received(self, name):
+        """ (value, timestamp) of the last values sent to the input name, oldest first. """
+        with self._lock:
+            return list(self._received.get(name, ()))
+
+    def report(self, level, message):
+        reader = self._report_reader
+        if reader is not None:
+            reader(None, level, message.encode("utf-8"))
+
+    # Engine
+
+    def _now(self):
+        return int((time.monotonic() - self._origin) * 1e6) + 1
+
+    def maps_init(self, argc, argv):
+        return 0
+
+    def maps_exit(self):
+        self._running = False
+        return 0
+
+    def maps_run(self):
+        with self._lock:
+            if not self._running:
+                self._origin = time.monotonic()
+                self._running = True
+                self._paused = False
+                for producer in self.producers.values():
+                    producer.start(self._now())
+        return 0
+
+    def maps_shutdown(self):
+        self._running = False
+        self._paused = False
+        return 0
+
+    def maps_reset(self):
+        self.maps_shutdown()
+        with self._lock:
+            self.diagram = DiagramIndex(None)
+            for name in self._diagram_producers:
+                self.producers.pop(name, None)
+            self._diagram_producers.clear()
+            self._received.clear()
+        return 0
+
+    def maps_play(self):
+        self._paused = False
+        return 0
+
+    def maps_pause(self):
+        self._paused = True
+        return 0
+
+    def maps_stop(self):
+        return self.maps_shutdown()
+
+    def maps_get_current_time(self, time_ref):
+        _target(time_ref).value = self._now() if self._running else 0
+        return 0
+
+    def maps_is_running(self, running_ref):
+        _target(running_ref).value = int(self._running)
+        return 0
+
+    def maps_is_paused(self, paused_ref):
+        _target(paused_ref).value = int(self._paused)
+        return 0
+
+    def maps_report(self, message, level):
+        self.report(level, message.decode("utf-8"))
+        return 0
+
+    def maps_register_report_reader(self, reader, context):
+        self._report_reader = reader
+        return 0
+
+    # Commands
+
+    def maps_parse(self, command):
+        command = command.decode("utf-8")
+        self.report(REPORT_CMD, command)
+        try:
+            self._execute(command.strip())
+        except RTMapsException as ex:
+            self.report(REPORT_ERROR, "Error: {}".format(ex))
+            return -1
+        return 0
+
+    def _execute(self, command):
+        tokens = command.split()
+        if not tokens or command.startswith(("#", "//")):
+            return
+        if tokens[0] == "loaddiagram":
+            self._load_diagram(command[len("loaddiagram"):].strip().strip("<>").strip())
+        elif command in ("run", "shutdown", "reset"):
+            getattr(self, "maps_" + command)()
+        elif tokens[0] in ("register", "unregister", "set_location"):
+            pass
+        elif tokens[0] == "kill" and len(tokens) == 2:
+            self._check_component(tokens[1])
+            with self._lock:
+                self.diagram.apply_command(command)
+                self._remove_producer(tokens[1] + ".output")
+        elif "=" in command and not any(char.isspace() for char in command.partition("=")[0].strip()):
+            self._set_property(command)
+        elif " -> " in command or " -X- " in command:
+            producer, consumer = [part.strip() for part in command.replace(" -X- ", " -> ").split(" -> ", 1)]
+            self._check_port(producer, "outputs")
+            self._check_port(consumer, "inputs")
+            with self._lock:
+                self.diagram.apply_command(command)
+        elif len(tokens) == 2 and "." not in command:
+            if tokens[1] in self.diagram.components:
+                raise RTMapsException("A component named {} already exists".format(tokens[1]))
+            with self._lock:
+                self.diagram.apply_command(command)
+                if tokens[1] not in self.diagram.components:
+                    raise RTMapsException("{} is not a valid component name".format(tokens[1]))
+                model = self.models.get(tokens[0])
+                if model is not None:
+                    self.diagram.properties[tokens[1]].update(model.properties)
+                self._update_producer(tokens[1])
+        elif len(tokens) == 1 and command.count(".") == 1:
+            component_id, action = command.split(".")
+            if action not in self._names(component_id, "actions"):
+                raise RTMapsException("Unknown action {}".format(command))
+        else:
+            raise RTMapsException("Unknown command '{}'".format(command))
+
+    def _load_diagram(self, path):
+        try:
+            index = DiagramIndex.load(path)
+        except (OSError, ValueError) as ex:
+            raise RTMapsException("Cannot load diagram {}: {}".format(path, ex))
+        with self._lock:
+            for component_id, model in index.components.items():
+                defaults = dict(self.models[model].properties) if model in self.models else dict()
+                defaults.update(index.properties.get(component_id, {}))
+                index.properties[component_id] = defaults
+            self.diagram.update(index)
+            for component_id in index.components:
+                self._update_producer(component_id)
+
+    def _set_property(self, command):
+        target, _, value = command.partition("=")
+        component_id, _, property_name = target.strip().partition(".")
+        self._check_component(component_id)
+        model = self.models.get(self.diagram.components[component_id])
+        if model is not None and property_name not in model.properties:
+            raise RTMapsException("Component {} has no property {}".format(component_id, property_name))
+        value = value.strip()
+        if value.startswith("<<") and value.endswith(">>"):
+            value = value[2:-2]
+        enum = model.enums.get(property_name) if model is not None else None
+        if enum is not None:
+            if value.isdigit() and int(value) < len(enum):
+                value = enum[int(value)]
+            elif value not in enum:
+                raise RTMapsException("{} is not a valid value of {}".format(value, target.strip()))
+        with self._lock:
+            self.diagram.properties[component_id][property_name] = value
+            self._update_producer(component_id)
+
+    def _update_producer(self, component_id):
+        """ (Re)creates the producer of a SimulatedProducer component from its properties. Called with the lock. """
+        if self.diagram.components.get(component_id) != "SimulatedProducer":
+            return
+        properties = self.diagram.properties[component_id]
+        name = component_id + ".output"
+        try:
+            producer = SimulatedProducer(properties["kind"], float(properties["rate"]), int(properties["vector_size"]),
+                                         float(properties["jitter"]), int(properties["fifosize"]), seed=int(properties["seed"]))
+        except (KeyError, ValueError) as ex:
+            raise RTMapsException("Invalid properties of {}: {}".format(component_id, ex))
+        if self._running:
+            producer.start(self._now())
+        self.producers[name] = producer
+        self._diagram_producers.add(name)
+
+    def _remove_producer(self, name):
+        if name in self._diagram_producers:
+            self._diagram_producers.discard(name)
+            self.producers.pop(name, None)
+
+    def _check_component(self, component_id):
+        if component_id not in self.diagram.components:
+            raise RTMapsException("Unknown component {}".format(component_id))
+
+    def _check_port(self, name, kind):
+        component_id, _, port = name.partition(".")
+        self._check_component(component_id)
+        if port not in self._names(component_id, kind):
+            raise RTMapsException("Component {} has no {} {}".format(component_id, kind[:-1], port))
+
+    def _names(self, component_id, kind):
+        """ Names of the "outputs", "inputs", "properties" or "actions" of a component. """
+        model = self.models.get(self.diagram.components.get(component_id))
+        if kind == "properties":
+            return list(self.diagram.properties.get(component_id, {}))
+        names = list(getattr(model, kind)) if model is not None else []
+        if kind in ("outputs", "inputs"):
+            declared = getattr(self.diagram, kind).get(component_id, [])  # from .rtd files
+            names += [name for name in declared if name not in names]
+        if kind == "outputs":
+            prefix = component_id + "."
+            names += [name[len(prefix):] for name in self.producers if name.startswith(prefix) and name[len(prefix):] not in names]
+        return names
+
+    # Properties and introspection
+
+    def _property(self, name):
+        component_id, _, property_name = name.decode("utf-8").partition(".")
+        try:
+            return self.diagram.properties[component_id][property_name]
+        except KeyError:
+            return None
+
+    def maps_get_integer_property(self, name, value_ref):
+        value = self._property(name)
+        try:
+            _target(value_ref).value = int(float(value)) if value not in ("true", "false") else int(value == "true")
+        except (TypeError, ValueError):
+            return -1
+        return 0
+
+    def maps_get_float_property(self, name, value_ref):
+        try:
+            _target(value_ref).value = float(self._property(name))
+        except (TypeError, ValueError):
+            return -1
+        return 0
+
+    def maps_get_string_property(self, name, buffer, size_ref):
+        value = self._property(name)
+        return _put_string(value if value is not None else "", buffer, size_ref)
+
+    def maps_get_enum_property(self, name, buffer, size_ref):
+        component_id, _, property_name = name.decode("utf-8").partition(".")
+        model = self.models.get(self.diagram.components.get(component_id))
+        enum = model.enums.get(property_name) if model is not None else None
+        if enum is None:
+            return _put_string("", buffer, size_ref)
+        value = self.diagram.properties[component_id].get(property_name)
+        selected = enum.index(value) if value in enum else 0
+        return _put_string("|".join([str(len(enum)), str(selected)] + list(enum)), buffer, size_ref)
+
+    def _put_names(self, component, kind, buffer, size_ref):
+        component_id = component.decode("utf-8")
+        names = ["{}.{}".format(component_id, name) for name in self._names(component_id, kind)]
+        return _put_string("|".join(names), buffer, size_ref)
+
+    def maps_get_action_names_for_component(self, component, buffer, size_ref):
+        return self._put_names(component, "actions", buffer, size_ref)
+
+    def maps_get_output_names_for_component(self, component, buffer, size_ref):
+        return self._put_names(component, "outputs", buffer, size_ref)
+
+    def maps_get_input_names_for_component(self, component, buffer, size_ref):
+        return self._put_names(component, "inputs", buffer, size_ref)
+
+    def maps_get_property_names_for_component(self, component, buffer, size_ref):
+        return self._put_names(component, "properties", buffer, size_ref)
+
+    # Sends
+
+    def _send(self, name, value, timestamp):
+        name = name.decode("utf-8")
+        component_id, _, input_name = name.partition(".")
+        model = self.models.get(self.diagram.components.get(component_id))
+        if component_id not in self.diagram.components or (model is not None and input_name not in self._names(component_id, "inputs")):
+            return -1
+        with self._lock:
+            received = self._received.get(name)
+            if received is None:
+                received = self._received[name] = deque(maxlen=self._received_size)
+            received.append((value, timestamp if timestamp is not None else self._now()))
+        return 0
+
+    def maps_send_int32(self, name, value):
+        return self._send(name, value, None)
+
+    def maps_send_int32_ts(self, name, value, timestamp):
+        return self._send(name, value, timestamp)
+
+    def maps_send_int64_ts(self, name, value, timestamp):
+        return self._send(name, value, timestamp)
+
+    def maps_send_float64_ts(self, name, value, timestamp):
+        return self._send(name, value, timestamp)
+
+    # Reads
+
+    def _read(self, name, timeout):
+        """ Waits up to timeout microseconds (None: forever) for the next sample of the output name. """
+        producer = self.producers.get(name.decode("utf-8"))
+        deadline = None if timeout is None else time.monotonic() + max(timeout, 0) / 1e6
+        while self._running and producer is not None:
+            with self._lock:
+                now = self._now()
+                issued = producer.next_issue_time(now)
+                if issued <= now:
+                    return producer.take()
+            wait = (issued - now) / 1e6
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                wait = min(wait, remaining)
+            time.sleep(wait)
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining > 0:
+                time.sleep(remaining)
+        return None
+
+    def _read_scalar(self, name, timeout, value_ref, timestamp_ref, convert):
+        sample = self._read(name, timeout)
+        if sample is None:
+            return -1
+        _target(value_ref).value = convert(np.asarray(sample[3]).ravel()[0] if np.ndim(sample[3]) else sample[3])
+        _target(timestamp_ref).value = sample[1]
+        return 0
+
+    def maps_read_int32(self, name, wait_for_data, value_ref, timestamp_ref):
+        return self._read_scalar(name, None if wait_for_data else 0, value_ref, timestamp_ref, int)
+
+    def maps_read_int64(self, name, wait_for_data, value_ref, timestamp_ref):
+        return self._read_scalar(name, None if wait_for_data else 0, value_ref, timestamp_ref, int)
+
+    def maps_read_int32_timeout(self, name, timeout, value_ref, timestamp_ref):
+        return self._read_scalar(name, timeout, value_ref, timestamp_ref, int)
+
+    def maps_read_int64_timeout(self, name, timeout, value_ref, timestamp_ref):
+        return self._read_scalar(name, timeout, value_ref, timestamp_ref, int)
+
+    def maps_read_float64_timeout(self, name, timeout, value_ref, timestamp_ref):
+        return self._read_scalar(name, timeout, value_ref, timestamp_ref, float)
+
+    def maps_read_text_timeout(self, name, timeout, buffer, size_ref, timestamp_ref):
+        sample = self._read(name, timeout)
+        if sample is None:
+            return -1
+        if timestamp_ref is not None:
+            _target(timestamp_ref).value = sample[1]
+        return _put_string(str(sample[3]), buffer, size_ref)
+
+    def _read_buffer(self, name, timeout, buffer, size_ref, meta_ref, to_bytes):
+        sample = self._read(name, timeout)
+        if sample is None:
+            return -1
+        index, timestamp, issued, value = sample
+        data = to_bytes(value)
+        size = _target(size_ref)
+        size.value = min(len(data), size.value)
+        ctypes.memmove(_address(buffer), data, size.value)
+        if meta_ref is not None:
+            meta = _target(meta_ref)
+            meta.timestamp = timestamp
+            meta.timeOfIssue = issued
+            meta.frequency = int(self.producers[name.decode("utf-8")].rate * 1000)  # in mHz
+            meta.quality = 0
+        return 0
+
+    def maps_read_float64_vector_timeout_meta(self, name, timeout, vector, size_ref, meta_ref):
+        capacity = _target(size_ref).value
+        _target(size_ref).value = capacity * 8  # sizes of _read_buffer are in bytes
+        result = self._read_buffer(name, timeout, vector, size_ref, meta_ref,
+                                   lambda value: np.ascontiguousarray(value, dtype=np.float64).ravel().tobytes())
+        _target(size_ref).value //= 8
+        return result
+
+    def maps_read_user_structure_timeout_meta(self, name, timeout, buffer, size_ref, meta_ref):
+        size = _target(size_ref).value
+        return self._read_buffer(name, timeout, buffer, size_ref, meta_ref,
+                                 lambda value: value if isinstance(value, bytes) else
+                                 np.asarray(value).tobytes() if np.ndim(value) else bytes(size))
+
+    def maps_read_stream8_timeout_meta(self, name, timeout, buffer, size_ref, meta_ref):
+        return self._read_buffer(name, timeout, buffer, size_ref, meta_ref,
+                                 lambda value: bytes(value) if isinstance(value, (bytes, bytearray)) else
+                                 str(value).encode("utf-8") if not np.ndim(value) else np.asarray(value).tobytes())